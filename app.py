@@ -1,16 +1,95 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+import base64
+import errno
+import binascii
+import bisect
+import hashlib
+import hmac
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Request, abort, before_render_template, g, template_rendered, render_template, request, redirect, url_for, session, jsonify, send_file
 import json
+import logging
 from functools import wraps
-import glob
-import uuid
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import safe_join, secure_filename
 import shutil
+import threading
+import time
+import uuid
+import mimetypes
+from urllib.parse import quote
+import click
+
+import font_build
+from app_logging import setup_logging
+import image_variants
+from attractions import AttractionRepository
+from content_cache import JsonFileCache, thaw, write_json_atomic
+from image_catalog import ImageCatalog
+from image_index import ImageIndex
+from jobs import JobError, JobQueue
+from metrics import PROMETHEUS_CONTENT_TYPE, Metrics
+from profiling import PROFILE_SORT_KEYS, ProfileStore, setup_profiling
+from render_cache import RenderCache
+from static_export import StaticExport
+from static_assets import AssetFingerprints, PrecompressedAssets, is_compressible
+from storage import JsonStorage, SqliteStorage, StorageError
+from uploads import UploadError, store_uploaded_image
 
 
-app = Flask(__name__)
+# Папку статики можно переопределить (например, для бенчмарков на синтетических данных)
+app = Flask(__name__, static_folder=os.environ.get('DOLINA_STATIC_FOLDER', 'static'))
 app.secret_key = 'dolina_waterfalls_secret_key_2025'
 
+# Журнал пишется через очередь в отдельном потоке (уровень: DOLINA_LOG_LEVEL)
+logger = logging.getLogger(__name__)
+log_pipeline = setup_logging(app)
+
+# Метрики для /metrics (Prometheus); доступ по сессии администратора или токену
+metrics = Metrics()
+metrics.describe('dolina_requests_total', 'counter', 'Запросы по маршруту, методу и статусу')
+metrics.describe('dolina_request_duration_seconds', 'histogram', 'Время обработки запроса по маршруту')
+metrics.describe('dolina_operation_duration_seconds', 'histogram', 'Время загрузки данных и сканирования папок')
+metrics.describe('dolina_template_render_seconds', 'histogram', 'Время отрисовки шаблонов')
+metrics.describe('dolina_render_cache_total', 'counter', 'Обращения к кэшу главной страницы')
+metrics.describe('dolina_uploads_total', 'counter', 'Загруженные файлы по результату')
+metrics.describe('dolina_upload_bytes_total', 'counter', 'Записано байт загруженных файлов')
+METRICS_TOKEN = os.environ.get('DOLINA_METRICS_TOKEN')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe('dolina_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+        metrics.inc('dolina_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+_template_timers = threading.local()
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    stack = getattr(_template_timers, 'stack', None)
+    if stack is None:
+        stack = _template_timers.stack = []
+    stack.append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def record_template_time(sender, template, context, **extra):
+    stack = getattr(_template_timers, 'stack', None)
+    if stack:
+        metrics.observe('dolina_template_render_seconds', time.perf_counter() - stack.pop(),
+                        template=template.name or 'string')
+
+def timed_operation(name):
+    """Декоратор: время выполнения функции в dolina_operation_duration_seconds"""
+    return metrics.timed('dolina_operation_duration_seconds', operation=name)
+
 # Конфигурация администратора
 ADMIN_CREDENTIALS = {
     'username': 'admin',
@@ -21,11 +100,50 @@ ADMIN_CREDENTIALS = {
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 
+# Пакетная загрузка: лимит файлов и общего размера запроса
+MAX_BATCH_FILES = 50
+MAX_BATCH_SIZE = 256 * 1024 * 1024  # 256MB
+
+# Файлы пакета записываются и обрабатываются параллельно этим числом потоков
+# (не меньше двух: пока один поток ждет fsync, другой кодирует копии)
+UPLOAD_WORKERS = max(2, min(4, os.cpu_count() or 1))
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+
+# Werkzeug отклоняет слишком большие запросы до разбора тела (запас на заголовки multipart)
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE + 64 * 1024
+
+# Маршруты пакетной загрузки, для которых действует лимит MAX_BATCH_SIZE
+BATCH_UPLOAD_ENDPOINTS = frozenset({
+    'upload_images_batch',
+    'upload_gallery_images_batch',
+    'upload_attraction_images_batch',
+})
+
+class DolinaRequest(Request):
+    """Запрос с лимитом размера, зависящим от маршрута"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint in BATCH_UPLOAD_ENDPOINTS:
+            return MAX_BATCH_SIZE + 64 * 1024
+        return super().max_content_length
+
+app.request_class = DolinaRequest
+
 def allowed_file(filename):
     """Проверка разрешенных расширений файлов"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.errorhandler(413)
+def request_entity_too_large(error):
+    """Ответ на запрос больше MAX_CONTENT_LENGTH"""
+    if request.endpoint in BATCH_UPLOAD_ENDPOINTS:
+        message = f'Слишком большой пакет. Максимальный общий размер: {MAX_BATCH_SIZE // (1024*1024)}MB'
+    else:
+        message = f'Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // (1024*1024)}MB'
+    return jsonify({'success': False, 'message': message}), 413
+
 # Декоратор для защиты маршрутов, требующих авторизации
 def login_required(f):
     @wraps(f)
@@ -37,207 +155,621 @@ def login_required(f):
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Папка с файлами данных (по умолчанию папка проекта)
+DATA_DIR = os.environ.get('DOLINA_DATA_DIR', BASE_DIR)
+
 # Путь к файлу с данными страницы
-DATA_FILE = os.path.join(BASE_DIR, 'page_data.json')
-ATTRACTIONS_FILE = os.path.join(BASE_DIR, 'attractions_data.json')
+DATA_FILE = os.path.join(DATA_DIR, 'page_data.json')
+ATTRACTIONS_FILE = os.path.join(DATA_DIR, 'attractions_data.json')
+
+# Профили запросов администратора (?_profile=1 или X-Profile: 1), последние N на диске
+PROFILE_DIR = os.environ.get('DOLINA_PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+profile_store = ProfileStore(PROFILE_DIR)
+setup_profiling(app, profile_store)
+
+# Фоновые задания админ-панели (обработка изображений, удаление папок): таблица
+# в SQLite и JOB_WORKERS потоков в каждом процессе приложения
+JOBS_FILE = os.environ.get('DOLINA_JOBS_FILE', os.path.join(DATA_DIR, 'jobs.sqlite3'))
+JOB_WORKERS = int(os.environ.get('DOLINA_JOB_WORKERS', '1'))
+job_queue = JobQueue(JOBS_FILE, JOB_WORKERS)
+
+@app.before_request
+def start_job_queue():
+    # Потоки очереди запускаются при первом запросе процесса (в том числе после fork)
+    job_queue.start()
+
+# Папки удаленных блоков до фонового удаления: вне static, чтобы их не раздавал сервер.
+# Должна быть на том же диске, что и static (перенос — один rename)
+TRASH_DIR = os.environ.get('DOLINA_TRASH_DIR', os.path.join(DATA_DIR, '.trash'))
+
+def static_job_path(path):
+    """Путь внутри папки статики из параметров задания"""
+    folder = safe_join(app.static_folder, path)
+    if folder is None:
+        raise JobError(f"Недопустимый путь: {path}")
+    return folder
+
+# Кэш разобранных данных (перепроверка изменений не чаще раза в N мс)
+CONTENT_CACHE_CHECK_INTERVAL_MS = 1000
 
+# Хранилище контента: 'json' (по умолчанию) или 'sqlite'
+STORAGE_BACKEND = os.environ.get('DOLINA_STORAGE', 'json')
+SQLITE_FILE = os.environ.get('DOLINA_SQLITE_FILE', os.path.join(DATA_DIR, 'content.sqlite3'))
+
+def create_storage(backend):
+    """Создание хранилища контента по имени"""
+    if backend == 'json':
+        return JsonStorage(DATA_FILE, ATTRACTIONS_FILE, CONTENT_CACHE_CHECK_INTERVAL_MS)
+    if backend == 'sqlite':
+        return SqliteStorage(SQLITE_FILE, CONTENT_CACHE_CHECK_INTERVAL_MS)
+    raise ValueError(f"Неизвестное хранилище: {backend}")
+
+storage = create_storage(STORAGE_BACKEND)
+
+def get_page_data_snapshot():
+    """Неизменяемый снимок данных страницы (для отрисовки)"""
+    return storage.get_page_data()
+
+@timed_operation('load_attractions')
+def get_attractions_snapshot():
+    """Неизменяемый снимок достопримечательностей без изображений"""
+    return storage.get_attractions()
+
+@timed_operation('load_page_data')
 def load_page_data():
-    """Загрузка данных страницы из файла"""
-    try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Ошибка при загрузке данных: {e}")
-        return {}
+    """Загрузка данных страницы (изменяемая копия)"""
+    return thaw(storage.get_page_data())
 
 def save_page_data(data):
-    """Сохранение данных страницы в файл"""
+    """Сохранение данных страницы"""
     try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        storage.replace_page_data(data)
         return True
-    except Exception as e:
-        print(f"Ошибка при сохранении данных: {e}")
+    except Exception:
+        logger.exception("Ошибка при сохранении данных")
         return False
 
-def load_attractions():
-    """Загрузка данных достопримечательностей"""
-    try:
-        with open(ATTRACTIONS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Ошибка при загрузке достопримечательностей: {e}")
-        return []
-
 def save_attractions(attractions):
     """Сохранение данных достопримечательностей (без изображений)"""
     try:
-        # Создаем копию без изображений для сохранения
-        attractions_to_save = []
-        for attraction in attractions:
-            attraction_copy = attraction.copy()
-            # Удаляем поле images из JSON, так как они хранятся в файловой системе
-            if 'images' in attraction_copy:
-                del attraction_copy['images']
-            attractions_to_save.append(attraction_copy)
-        
-        print(f"Сохранение {len(attractions_to_save)} достопримечательностей в {ATTRACTIONS_FILE}")
-        with open(ATTRACTIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(attractions_to_save, f, ensure_ascii=False, indent=2)
-        
-        # Проверяем, что файл был сохранен
-        if os.path.exists(ATTRACTIONS_FILE):
-            file_size = os.path.getsize(ATTRACTIONS_FILE)
-            print(f"Файл успешно сохранен. Размер: {file_size} байт")
-        else:
-            print("ОШИБКА: Файл не был создан!")
-            
+        # Поле images в данные не попадает: изображения хранятся в файловой системе
+        storage.replace_attractions(attractions)
         return True
-    except Exception as e:
-        print(f"Ошибка при сохранении достопримечательностей: {e}")
+    except Exception:
+        logger.exception("Ошибка при сохранении достопримечательностей")
         return False
 
-def load_attractions():
-    """Загрузка данных достопримечательностей"""
-    try:
-        print(f"Загрузка достопримечательностей из {ATTRACTIONS_FILE}")
-        if not os.path.exists(ATTRACTIONS_FILE):
-            print(f"Файл {ATTRACTIONS_FILE} не существует. Создаем пустой список.")
-            return []
-            
-        with open(ATTRACTIONS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            print(f"Загружено {len(data)} достопримечательностей")
-            
-            # Добавляем изображения из папок
-            for attraction in data:
-                attraction_id = attraction.get('id')
-                if attraction_id:
-                    # Получаем изображения из папки
-                    attraction['images'] = get_attraction_images(attraction_id)
-            
-            return data
-    except Exception as e:
-        print(f"Ошибка при загрузке достопримечательностей: {e}")
-        return []
+# Постоянный индекс метаданных изображений (хэш, размеры, формат) в файле .images.json каждой папки
+image_index = ImageIndex(ALLOWED_EXTENSIONS, CONTENT_CACHE_CHECK_INTERVAL_MS)
+
+# Индекс папок с изображениями: вместо glob на каждый запрос (из image_index, если он у папки есть)
+image_catalog = ImageCatalog(ALLOWED_EXTENSIONS, CONTENT_CACHE_CHECK_INTERVAL_MS, metadata_index=image_index)
 
-def get_next_attraction_id():
-    """Получить следующий ID для новой достопримечательности"""
-    attractions = load_attractions()
-    if not attractions:
-        return 1
-    max_id = max(attraction.get('id', 0) for attraction in attractions)
-    return max_id + 1
+# Повторная загрузка того же файла (по sha256): 'link' — вернуть уже загруженный,
+# 'reject' — отказать, 'off' — сохранить копию
+UPLOAD_DEDUP = os.environ.get('DOLINA_UPLOAD_DEDUP', 'link')
 
+def get_attraction_images_dir(attraction_id):
+    """Папка с изображениями достопримечательности"""
+    return os.path.join(app.static_folder, 'images', 'attraction-block', f"block-{attraction_id}")
+
+@timed_operation('get_attraction_images')
 def get_attraction_images(attraction_id):
     """Получение списка изображений для достопримечательности из папки"""
-    folder_name = f"block-{attraction_id}"
-    images_dir = os.path.join(app.static_folder, 'images', 'attraction-block', folder_name)
-    images = []
-    
-    if os.path.exists(images_dir):
-        extensions = ('*.jpg', '*.jpeg', '*.png', '*.webp', '*.gif')
-        for ext in extensions:
-            images.extend(glob.glob(os.path.join(images_dir, ext)))
-        
-        # Сортируем по имени и берем только имена файлов
-        images.sort()
-        images = [os.path.basename(img) for img in images]
-    
-    return images
+    return image_catalog.names(get_attraction_images_dir(attraction_id))
+
+# Достопримечательности по id; изображения подгружаются только по запросу
+attractions_repo = AttractionRepository(storage, get_attraction_images, get_attractions_snapshot)
 
+@timed_operation('get_hero_images')
 def get_hero_images():
     """Получить список изображений для героя"""
     images_dir = os.path.join(app.static_folder, 'images', 'hero-section')
-    images = []
-    
-    if os.path.exists(images_dir):
-        # Получаем все изображения с расширениями jpg, jpeg, png, webp, gif
-        extensions = ('*.jpg', '*.jpeg', '*.png', '*.webp', '*.gif')
-        for ext in extensions:
-            images.extend(glob.glob(os.path.join(images_dir, ext)))
-        
-        # Сортируем по имени
-        images.sort()
-        
-        # Преобразуем полные пути в относительные для использования в шаблоне
-        images = [os.path.relpath(img, app.static_folder).replace('\\', '/') for img in images]
     
-    return images
+    # Относительные пути для шаблона, адаптивные копии, размеры и заглушка
+    return [{
+        'filename': entry.name,
+        'path': f"images/hero-section/{entry.name}",
+        'variants': image_variants.describe_variants(images_dir, 'images/hero-section', entry.name),
+        **image_variants.describe_placeholder(images_dir, entry.name)
+    } for entry in image_catalog.list(images_dir)]
 
 def get_image_info():
     """Получить информацию об изображениях (размер, дата создания)"""
     images_dir = os.path.join(app.static_folder, 'images', 'hero-section')
-    images_info = []
-    
-    if os.path.exists(images_dir):
-        extensions = ('*.jpg', '*.jpeg', '*.png', '*.webp', '*.gif')
-        for ext in extensions:
-            for img_path in glob.glob(os.path.join(images_dir, ext)):
-                try:
-                    stat = os.stat(img_path)
-                    images_info.append({
-                        'filename': os.path.basename(img_path),
-                        'path': os.path.relpath(img_path, app.static_folder).replace('\\', '/'),
-                        'size': stat.st_size,
-                        'created': stat.st_ctime,
-                        'modified': stat.st_mtime
-                    })
-                except:
-                    continue
-        
-        # Сортируем по имени
-        images_info.sort(key=lambda x: x['filename'])
-    
-    return images_info
+    return [{
+        'filename': entry.name,
+        'path': f"images/hero-section/{entry.name}",
+        'size': entry.size,
+        'created': entry.created,
+        'modified': entry.modified
+    } for entry in image_catalog.list(images_dir)]
 
 # Добавим в конфигурацию
 GALLERY_FOLDER = 'gallery-section'
 
 # Добавим функции для работы с галереей
+def get_gallery_dir():
+    return os.path.join(app.static_folder, 'images', GALLERY_FOLDER)
+
+def describe_gallery_image(images_dir, entry):
+    """Описание одного изображения галереи по записи каталога"""
+    return {
+        'filename': entry.name,
+        'path': f"images/{GALLERY_FOLDER}/{entry.name}",
+        'size': entry.size,
+        'created': entry.created,
+        'modified': entry.modified,
+        'variants': image_variants.describe_variants(images_dir, f'images/{GALLERY_FOLDER}', entry.name),
+        **image_variants.describe_placeholder(images_dir, entry.name)
+    }
+
+@timed_operation('get_gallery_images')
 def get_gallery_images():
     """Получить список изображений галереи"""
-    images_dir = os.path.join(app.static_folder, 'images', GALLERY_FOLDER)
-    images = []
+    images_dir = get_gallery_dir()
+    return [describe_gallery_image(images_dir, entry) for entry in image_catalog.list(images_dir)]
+
+def get_attraction_image_variants(attraction_id, images):
+    """Адаптивные копии изображений достопримечательности: имя файла -> список ширин"""
+    images_dir = get_attraction_images_dir(attraction_id)
+    static_path = f'images/attraction-block/block-{attraction_id}'
+    return {image: image_variants.describe_variants(images_dir, static_path, image) for image in images}
+
+def get_attraction_image_placeholders(attraction_id, images):
+    """Размеры и заглушки изображений достопримечательности: имя файла -> описание"""
+    images_dir = get_attraction_images_dir(attraction_id)
+    return {image: image_variants.describe_placeholder(images_dir, image) for image in images}
+
+@job_queue.handler('image_variants')
+@timed_operation('process_uploaded_image')
+def process_uploaded_image(job, path, filename):
+    """Задание: адаптивные копии и заглушка для загруженного изображения"""
+    try:
+        return generate_upload_variants(static_job_path(path), filename)
+    finally:
+        # Пакет загрузки ставит задание на каждый файл: поколение меняется
+        # один раз, когда очередь копий опустела (в том числе после пропуска)
+        if job_queue.pending('image_variants') == 0:
+            render_cache.bump()
+
+def generate_upload_variants(upload_folder, filename):
+    """Копии загруженного файла; {'skipped': True}, если файл уже удален"""
+    source_path = os.path.join(upload_folder, filename)
+    if not os.path.exists(source_path):
+        # Изображение удалили раньше, чем до него дошла очередь
+        return {'skipped': True}
+    try:
+        image_variants.generate_variants(upload_folder, filename)
+    except FileNotFoundError:
+        if os.path.exists(source_path):
+            raise
+        # Изображение или весь блок удалили посреди обработки: повторять нечего
+        return {'skipped': True}
+    if not os.path.exists(source_path):
+        image_variants.remove_variants(upload_folder, filename)
+        return {'skipped': True}
+    return {'filename': filename}
+
+def submit_image_processing(upload_folder, filename):
+    """Постановка обработки изображения в очередь; id задания или None"""
+    if not image_variants.variants_available():
+        return None
+    return job_queue.submit('image_variants', path=os.path.relpath(upload_folder, app.static_folder),
+                            filename=filename)
+
+def submit_index_reconcile(upload_folder):
+    """Постановка сверки индекса метаданных папки в очередь; id задания"""
+    return job_queue.submit('reconcile_images', path=os.path.relpath(upload_folder, app.static_folder))
+
+@job_queue.handler('reconcile_images')
+def reconcile_images_job(job, path):
+    """Задание: сверка индекса метаданных папки с файлами"""
+    folder = static_job_path(path)
+    if not os.path.isdir(folder):
+        return {'skipped': True}
+    added, updated, removed = image_index.reconcile(folder)
+    return {'added': added, 'updated': updated, 'removed': removed}
+
+def find_duplicate_upload(upload_folder):
+    """Проверка содержимого загрузки по индексу папки (см. UPLOAD_DEDUP)"""
+    if UPLOAD_DEDUP == 'off':
+        return None
+
+    def find(sha256):
+        existing = image_index.find_by_hash(upload_folder, sha256)
+        if existing is not None and UPLOAD_DEDUP == 'reject':
+            raise UploadError(f'Такое изображение уже загружено: {existing}')
+        return existing
+    return find
+
+def record_upload(upload_folder):
+    """Запись нового файла в индекс метаданных (под блокировкой индекса папки)"""
+    def record(filename, sha256):
+        try:
+            image_index.add(upload_folder, filename, sha256)
+        except Exception:
+            logger.exception("Ошибка при обновлении индекса изображений %s", upload_folder)
+    return record
+
+def store_upload(file, upload_folder):
+    """store_uploaded_image с проверкой повторов и учетом в метриках загрузок"""
+    try:
+        stored = store_uploaded_image(file, upload_folder, MAX_FILE_SIZE, find_duplicate_upload(upload_folder),
+                                      lock=image_index.locked(upload_folder), record=record_upload(upload_folder))
+    except UploadError:
+        metrics.inc('dolina_uploads_total', result='rejected')
+        raise
+    if stored.duplicate:
+        metrics.inc('dolina_uploads_total', result='duplicate')
+        return stored
+    metrics.inc('dolina_uploads_total', result='stored')
+    metrics.inc('dolina_upload_bytes_total', stored.size)
+    return stored
+
+def register_upload(upload_folder, stored):
+    """Учет нового файла в каталоге и задание на создание копий; id задания или None
+
+    В индекс метаданных файл записывает store_upload."""
+    if stored.duplicate:
+        return None
+    image_catalog.add(upload_folder, stored.filename)
+    if image_index.is_partial(upload_folder):
+        # Первая загрузка в папку без индекса: остальные файлы сверяются в фоне
+        submit_index_reconcile(upload_folder)
+    return submit_image_processing(upload_folder, stored.filename)
+
+def forget_image(folder, filename):
+    """Удаление уже удаленного файла из индексов вместе с адаптивными копиями"""
+    image_catalog.remove(folder, filename)
+    try:
+        image_index.remove(folder, filename)
+    except Exception:
+        logger.exception("Ошибка при обновлении индекса изображений %s", folder)
+    remove_image_variants(folder, filename)
+
+def save_uploaded_file(file, upload_folder, static_path):
+    """Проверка, запись и обработка одного файла пакета; результат для ответа"""
+    result = {'original': file.filename}
+    if not file.filename:
+        result.update(success=False, message='Файл не выбран')
+        return result
+    if not allowed_file(file.filename):
+        result.update(success=False, message='Неподдерживаемый формат файла')
+        return result
+    try:
+        stored = store_upload(file, upload_folder)
+    except UploadError as e:
+        result.update(success=False, message=str(e))
+        return result
+
+    job_id = register_upload(upload_folder, stored)
+    result.update(success=True, filename=stored.filename, path=f'{static_path}/{stored.filename}', size=stored.size,
+                  duplicate=stored.duplicate, job=job_id)
+    return result
+
+def save_uploaded_batch(files, upload_folder, static_path):
+    """Параллельная запись пакета файлов; результаты в порядке файлов запроса"""
+    futures = [upload_executor.submit(save_uploaded_file, file, upload_folder, static_path) for file in files]
+    results = []
+    for file, future in zip(files, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logger.exception("Ошибка при загрузке %s", file.filename)
+            results.append({'original': file.filename, 'success': False, 'message': f'Ошибка при загрузке: {str(e)}'})
+    return results
+
+def batch_upload_response(upload_folder, static_path):
+    """Ответ пакетного маршрута загрузки: файлы берутся из полей images"""
+    files = request.files.getlist('images')
+    if not files:
+        return jsonify({'success': False, 'message': 'Файлы не найдены в запросе', 'results': []})
+    if len(files) > MAX_BATCH_FILES:
+        return jsonify({'success': False, 'message': f'Слишком много файлов. Максимум за раз: {MAX_BATCH_FILES}',
+                        'results': []})
+
+    results = save_uploaded_batch(files, upload_folder, static_path)
+    uploaded = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': uploaded == len(results),
+        'message': f'Загружено {uploaded} из {len(results)}',
+        'uploaded': uploaded,
+        'failed': len(results) - uploaded,
+        'results': results
+    })
+
+def remove_image_variants(upload_folder, filename):
+    """Удаление адаптивных копий вместе с оригиналом"""
+    try:
+        image_variants.remove_variants(upload_folder, filename)
+    except Exception:
+        logger.exception("Ошибка при удалении адаптивных копий %s", filename)
+
+@app.template_global()
+def image_srcset(variants, image_format='webp'):
+    """Строка srcset из списка адаптивных копий"""
+    return ', '.join(f"{url_for('static', filename=variant[image_format])} {variant['width']}w"
+                     for variant in variants)
+
+@app.template_global()
+def pick_variant(variants, width, image_format='jpeg'):
+    """Путь к наименьшей копии не уже width (или к самой большой из имеющихся)"""
+    for variant in variants:
+        if variant['width'] >= width:
+            return variant[image_format]
+    return variants[-1][image_format] if variants else None
+
+# Статика: URL из url_for('static', ...) получают отпечаток содержимого (?v=<hash>).
+# Такие URL кэшируются браузером навсегда, остальные - ненадолго
+STATIC_IMMUTABLE_MAX_AGE = 31536000  # 1 год
+STATIC_SHORT_MAX_AGE = 300  # 5 минут
+
+asset_fingerprints = AssetFingerprints(app.static_folder, CONTENT_CACHE_CHECK_INTERVAL_MS)
+
+@app.url_defaults
+def add_static_fingerprint(endpoint, values):
+    """Добавление отпечатка содержимого к URL статических файлов"""
+    if endpoint == 'static' and 'v' not in values:
+        fingerprint = asset_fingerprints.get(values.get('filename', ''))
+        if fingerprint:
+            values['v'] = fingerprint
+
+# Заранее сжатые копии (.br/.gz) текстовой статики, см. команду compress-static
+static_precompressed = PrecompressedAssets(app.static_folder)
+
+# Кто передает байты файлов статики:
+#   'direct'     — сам процесс; send_file использует wsgi.file_wrapper (sendfile),
+#                  если его дает WSGI-сервер (gunicorn, uWSGI)
+#   'x-accel'    — nginx по заголовку X-Accel-Redirect (внутренний location, см. readme)
+#   'x-sendfile' — Apache/lighttpd по заголовку X-Sendfile
+STATIC_DELIVERY = os.environ.get('DOLINA_STATIC_DELIVERY', 'direct')
+STATIC_ACCEL_PREFIX = os.environ.get('DOLINA_STATIC_ACCEL_PREFIX', '/_static_files/')
+app.config['USE_X_SENDFILE'] = STATIC_DELIVERY == 'x-sendfile'
+
+def accel_redirect_static(filename):
+    """Ответ без тела: файл отдаст nginx, заголовки кэширования выставит set_static_cache_headers"""
+    path = safe_join(app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = STATIC_ACCEL_PREFIX + quote(filename)
+    return response
+
+def serve_static(filename):
+    """Отдача статики: сжатая копия по Accept-Encoding или исходный файл"""
+    if STATIC_DELIVERY == 'x-accel':
+        # Сжатые копии nginx выбирает сам (gzip_static/brotli_static)
+        return accel_redirect_static(filename)
+    if not is_compressible(filename):
+        return app.send_static_file(filename)
     
-    if os.path.exists(images_dir):
-        extensions = ('*.jpg', '*.jpeg', '*.png', '*.webp', '*.gif')
-        for ext in extensions:
-            for img_path in glob.glob(os.path.join(images_dir, ext)):
-                try:
-                    stat = os.stat(img_path)
-                    images.append({
-                        'filename': os.path.basename(img_path),
-                        'path': os.path.relpath(img_path, app.static_folder).replace('\\', '/'),
-                        'size': stat.st_size,
-                        'created': stat.st_ctime,
-                        'modified': stat.st_mtime
-                    })
-                except Exception as e:
-                    print(f"Ошибка при получении информации о файле {img_path}: {e}")
-                    # Добавляем изображение с минимальной информацией
-                    images.append({
-                        'filename': os.path.basename(img_path),
-                        'path': os.path.relpath(img_path, app.static_folder).replace('\\', '/'),
-                        'size': 0,
-                        'created': 0,
-                        'modified': 0
-                    })
-        
-        # Сортируем по имени
-        images.sort(key=lambda x: x['filename'])
+    path = safe_join(app.static_folder, filename)
+    found = static_precompressed.find(path, request.accept_encodings) if path else None
+    if found is None:
+        response = app.send_static_file(filename)
+    else:
+        compressed_path, encoding = found
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_file(compressed_path, mimetype=mimetype, conditional=True)
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+app.view_functions['static'] = serve_static
+
+@app.after_request
+def set_static_cache_headers(response):
+    """Заголовки кэширования для статики в зависимости от отпечатка в URL"""
+    if request.endpoint != 'static' or response.status_code not in (200, 206, 304):
+        return response
+    
+    fingerprint = request.args.get('v')
+    filename = (request.view_args or {}).get('filename', '')
+    if fingerprint and fingerprint == asset_fingerprints.get(filename):
+        response.headers['Cache-Control'] = f'public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        # Без отпечатка (или с устаревшим) файл может поменяться по тому же URL
+        response.headers['Cache-Control'] = f'public, max-age={STATIC_SHORT_MAX_AGE}'
+    return response
+
+# Собранные командой build-fonts шрифты (WOFF2-подмножества и правила @font-face)
+font_manifest_cache = JsonFileCache(os.path.join(app.static_folder, font_build.FONTS_MANIFEST), dict,
+                                    CONTENT_CACHE_CHECK_INTERVAL_MS)
+
+def admin_write_succeeded(result):
+    """Ответ маршрута админ-панели означает изменение: код 2xx и success не False"""
+    response = app.make_response(result)
+    if not 200 <= response.status_code < 300:
+        return False
+    data = response.get_json(silent=True) if response.is_json else None
+    return not (isinstance(data, dict) and data.get('success') is False)
+
+# Кэш отрисованных публичных страниц; сбрасывается маршрутами админ-панели
+render_cache = RenderCache(admin_write_succeeded)
+invalidates_content = render_cache.invalidates
+
+def get_image_dirs_version():
+    """Версия папок с изображениями главной страницы и их манифестов копий"""
+    folders = [os.path.join(app.static_folder, 'images', 'hero-section')]
+    folders.extend(get_attraction_images_dir(attraction_id) for attraction_id in attractions_repo.ids())
+    
+    manifests = tuple(image_variants.manifest_version(folder) for folder in folders)
+    # list() перепроверяет папку не чаще раза в N мс и сам обновляет generation
+    for folder in folders:
+        image_catalog.list(folder)
+    return (image_catalog.generation, manifests)
+
+def get_index_cache_key():
+    """Ключ кэша главной страницы: поколение контента и версии исходных данных"""
+    generation = render_cache.generation
+    font_manifest_cache.get()
+    return (generation, storage.version(), get_image_dirs_version(), font_manifest_cache.version)
+
+# Семейства, шрифты которых предзагружаются на главной (и по умолчанию в build-fonts)
+PRELOAD_FONT_FAMILIES = ('Regular', 'Regular-logo')
+
+def get_fallback_preload_fonts():
+    """Исходные файлы PRELOAD_FONT_FAMILIES из fonts-source.css: (путь в static, MIME-тип)"""
+    try:
+        faces = font_build.parse_font_faces(os.path.join(app.static_folder, font_build.FONTS_SOURCE_STYLESHEET))
+    except FileNotFoundError:
+        return ()
+    fonts = []
+    for face in faces:
+        if face['family'].strip() in PRELOAD_FONT_FAMILIES:
+            path = os.path.relpath(face['source'], app.static_folder).replace(os.sep, '/')
+            fonts.append((path, 'font/' + path.rsplit('.', 1)[-1].lower()))
+    return tuple(fonts)
+
+# Шрифты для предзагрузки, пока не собраны WOFF2-подмножества (build-fonts): только те,
+# на которые ссылаются правила fonts-source.css
+FALLBACK_PRELOAD_FONTS = get_fallback_preload_fonts()
+# Первый слайд главного экрана растянут на всю ширину окна
+HERO_IMAGE_SIZES = '100vw'
+
+def get_index_preloads(hero_images=None):
+    """Критичные ресурсы главной страницы: стили, шрифты, первый слайд (LCP) и скрипт"""
+    preloads = [{'href': url_for('static', filename='css/styles.css'), 'as': 'style'}]
+    
+    fonts = font_manifest_cache.get()
+    if fonts and fonts.get('stylesheet'):
+        preloads.extend({'href': url_for('static', filename=font), 'as': 'font', 'type': 'font/woff2',
+                         'crossorigin': True} for font in fonts.get('preload', ()))
+    else:
+        # Без отпечатка: URL должен совпасть с url() в fonts-source.css, иначе шрифт скачается дважды
+        preloads.extend({'href': url_for('static', filename=font, v=None), 'as': 'font', 'type': font_type,
+                         'crossorigin': True} for font, font_type in FALLBACK_PRELOAD_FONTS)
+    
+    hero_images = get_hero_images() if hero_images is None else hero_images
+    if hero_images:
+        first = hero_images[0]
+        preload = {'href': url_for('static', filename=first['path']), 'as': 'image', 'fetchpriority': 'high'}
+        if first['variants']:
+            # Браузер выберет из srcset ту же копию, что и script.js (по ширине окна и плотности экрана)
+            preload.update(type='image/webp', imagesrcset=image_srcset(first['variants'], 'webp'),
+                           imagesizes=HERO_IMAGE_SIZES)
+        preloads.append(preload)
     
-    return images
+    preloads.append({'href': url_for('static', filename='js/script.js'), 'as': 'script'})
+    return preloads
+
+def format_link_header(preloads):
+    """Значение заголовка Link (rel=preload) для списка ресурсов"""
+    links = []
+    for preload in preloads:
+        parts = [f"<{preload['href']}>", 'rel=preload', f"as={preload['as']}"]
+        for name in ('type', 'imagesrcset', 'imagesizes', 'fetchpriority'):
+            if preload.get(name):
+                parts.append(f'{name}="{preload[name]}"')
+        if preload.get('crossorigin'):
+            parts.append('crossorigin')
+        links.append('; '.join(parts))
+    return ', '.join(links)
+
+def send_early_hints(link_header):
+    """Ответ 103 Early Hints, если сервер его поддерживает (wsgi.early_hints в gunicorn)"""
+    early_hints = request.environ.get('wsgi.early_hints')
+    if early_hints and link_header:
+        early_hints([('Link', link_header)])
+
+@timed_operation('render_index')
+def render_index(preloads=None):
+    """Отрисовка главной страницы в байты"""
+    page_data = get_page_data_snapshot()
+    hero_images = get_hero_images()
+    if preloads is None:
+        preloads = get_index_preloads(hero_images)
+    # Снимки не копируем целиком: достаточно поверхностной копии с изображениями
+    # (репозиторий уже отдает записи в порядке order)
+    attractions = []
+    for attraction in attractions_repo.ordered():
+        attraction = dict(attraction)
+        if attraction.get('id'):
+            attraction['images'] = attractions_repo.images(attraction['id'])
+            attraction['variants'] = get_attraction_image_variants(attraction['id'], attraction['images'])
+            attraction['placeholders'] = get_attraction_image_placeholders(attraction['id'], attraction['images'])
+        attractions.append(attraction)
+    html = render_template('index.html', page_data=page_data, hero_images=hero_images, attractions=attractions,
+                           fonts=font_manifest_cache.get(), preloads=preloads)
+    return html.encode('utf-8')
+
+def cache_index_page(key, preloads=None):
+    """Отрисовка главной страницы в кэш вместе с заголовком предзагрузки"""
+    if preloads is None:
+        preloads = get_index_preloads()
+    return render_cache.put('index', key, render_index(preloads), format_link_header(preloads))
 
 @app.route('/')
 def index():
-    """Главная страница"""
-    page_data = load_page_data()
-    hero_images = get_hero_images()
-    attractions = load_attractions()
-    # Сортируем достопримечательности по order
-    attractions.sort(key=lambda x: x.get('order', 0))
-    return render_template('index.html', page_data=page_data, hero_images=hero_images, attractions=attractions)
+    """Главная страница (из кэша, с поддержкой ETag и 304)"""
+    key = get_index_cache_key()
+    page = render_cache.get('index', key)
+    if page is None:
+        metrics.inc('dolina_render_cache_total', result='miss')
+        # Подсказки уходят клиенту до отрисовки страницы
+        preloads = get_index_preloads()
+        send_early_hints(format_link_header(preloads))
+        page = cache_index_page(key, preloads)
+    else:
+        metrics.inc('dolina_render_cache_total', result='hit')
+        if not request.if_none_match.contains(page.etag):
+            send_early_hints(page.links)
+    
+    response = app.response_class(page.body, mimetype='text/html')
+    if page.links:
+        response.headers['Link'] = page.links
+    response.set_etag(page.etag)
+    # Браузер хранит страницу, но каждый раз сверяет ETag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики в формате Prometheus (сессия администратора или Bearer-токен)"""
+    authorized = 'logged_in' in session
+    if not authorized and METRICS_TOKEN:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        authorized = scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())
+    if not authorized:
+        return app.response_class('Unauthorized\n', status=401, mimetype='text/plain',
+                                  headers={'WWW-Authenticate': 'Bearer'})
+    response = app.response_class(metrics.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/admin/jobs/<job_id>')
+@login_required
+def admin_job(job_id):
+    """Состояние и ход фонового задания (id из ответа маршрута, который его создал)"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Задание не найдено'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/admin/profiles')
+@login_required
+def admin_profiles():
+    """Список сохраненных профилей и отчет по выбранному"""
+    profiles = profile_store.list()
+    selected = request.args.get('id') or (profiles[0]['id'] if profiles else None)
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in PROFILE_SORT_KEYS:
+        sort = 'cumulative'
+    report = profile_store.report(selected, sort) if selected else None
+    return render_template('admin_profiles.html', active_tab='profiles', profiles=profiles,
+                           selected=selected, sort=sort, sort_keys=PROFILE_SORT_KEYS, report=report,
+                           profile_keep=profile_store.keep)
+
+@app.route('/admin/profiles/<profile_id>.prof')
+@login_required
+def download_profile(profile_id):
+    """Файл профиля в формате pstats (для snakeviz и подобных)"""
+    path = profile_store.stats_path(profile_id)
+    if path is None:
+        return jsonify({'success': False, 'message': 'Профиль не найден'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f'{profile_id}.prof')
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -282,13 +814,13 @@ def admin_home():
 
 @app.route('/admin/update', methods=['POST'])
 @login_required
+@invalidates_content
 def update_content():
     """Обновление контента через AJAX"""
     try:
-        page_data = load_page_data()
         data = request.get_json()
         
-        print(f"Полученные данные для обновления: {data}")
+        logger.debug("Полученные данные для обновления: %s", data)
         
         section = data.get('section')
         fields = data.get('fields')
@@ -303,84 +835,91 @@ def update_content():
         if section == 'stats':
             return jsonify({'success': False, 'message': 'Раздел статистики удален'})
         
-        if section not in page_data:
-            page_data[section] = {}
-        
-        for field, value in fields.items():
-            page_data[section][field] = value
-        
-        if save_page_data(page_data):
-            return jsonify({'success': True, 'message': 'Данные успешно обновлены'})
-        else:
+        # Все поля раздела меняются одной операцией хранилища
+        try:
+            storage.update_page_section(section, fields)
+        except Exception:
+            logger.exception("Ошибка при сохранении данных")
             return jsonify({'success': False, 'message': 'Ошибка при сохранении файла'})
+        
+        return jsonify({'success': True, 'message': 'Данные успешно обновлены'})
             
     except Exception as e:
-        print(f"Ошибка в update_content: {e}")
+        logger.exception("Ошибка в update_content")
         return jsonify({'success': False, 'message': f'Внутренняя ошибка сервера: {str(e)}'})
 
 @app.route('/admin/upload-image', methods=['POST'])
 @login_required
+@invalidates_content
 def upload_image():
     """Загрузка изображения"""
     try:
-        print("=== DEBUG: Начало загрузки изображения для слайдера ===")
-        print(f"Запрос файлов: {request.files}")
+        logger.debug("Начало загрузки изображения для слайдера")
+        logger.debug("Запрос файлов: %s", request.files)
         
         # Проверяем, есть ли файл в запросе
         if 'image' not in request.files:
-            print("DEBUG: Ключ 'image' не найден в request.files")
+            logger.debug("Ключ 'image' не найден в request.files")
             return jsonify({'success': False, 'message': 'Файл не найден в запросе'})
         
         file = request.files['image']
-        print(f"DEBUG: Получен файл: {file.filename}")
+        logger.debug("Получен файл: %s", file.filename)
         
         # Если пользователь не выбрал файл
         if file.filename == '':
-            print("DEBUG: Имя файла пустое")
+            logger.debug("Имя файла пустое")
             return jsonify({'success': False, 'message': 'Файл не выбран'})
         
-        # Проверяем размер файла
-        file.seek(0, 2)  # Переходим в конец файла
-        file_size = file.tell()
-        file.seek(0)  # Возвращаемся в начало
-        
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({'success': False, 'message': f'Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // (1024*1024)}MB'})
-        
         # Проверяем расширение файла
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'message': 'Неподдерживаемый формат файла. Разрешенные форматы: PNG, JPG, JPEG, GIF, WEBP'})
         
-        # Создаем безопасное имя файла
-        original_filename = secure_filename(file.filename)
-        name, ext = os.path.splitext(original_filename)
-        
-        # Генерируем уникальное имя файла, чтобы избежать конфликтов
-        unique_filename = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
-        
-        # Создаем папку, если ее нет
+        # Потоково сохраняем файл под уникальным именем (размер и формат проверяются по ходу записи)
         upload_folder = os.path.join(app.static_folder, 'images', 'hero-section')
-        os.makedirs(upload_folder, exist_ok=True)
+        try:
+            stored = store_upload(file, upload_folder)
+        except UploadError as e:
+            return jsonify({'success': False, 'message': str(e)})
         
-        # Сохраняем файл
+        unique_filename, file_size = stored.filename, stored.size
         file_path = os.path.join(upload_folder, unique_filename)
-        file.save(file_path)
+        job_id = register_upload(upload_folder, stored)
         
-        print(f"Файл сохранен: {file_path}")
+        logger.info("Файл сохранен: %s", file_path)
         
         return jsonify({
             'success': True, 
             'message': 'Изображение успешно загружено',
             'filename': unique_filename,
-            'path': f"images/hero-section/{unique_filename}"
+            'path': f"images/hero-section/{unique_filename}",
+            'size': file_size,
+            'duplicate': stored.duplicate,
+            'job': job_id
         })
         
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"Ошибка при загрузке изображения: {e}")
+        logger.exception("Ошибка при загрузке изображения")
         return jsonify({'success': False, 'message': f'Ошибка при загрузке: {str(e)}'})
 
+@app.route('/admin/upload-images', methods=['POST'])
+@login_required
+@invalidates_content
+def upload_images_batch():
+    """Пакетная загрузка изображений слайдера"""
+    try:
+        upload_folder = os.path.join(app.static_folder, 'images', 'hero-section')
+        return batch_upload_response(upload_folder, 'images/hero-section')
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.exception("Ошибка при пакетной загрузке изображений")
+        return jsonify({'success': False, 'message': f'Ошибка при загрузке: {str(e)}', 'results': []})
+
 @app.route('/admin/delete-image', methods=['POST'])
 @login_required
+@invalidates_content
 def delete_image():
     """Удаление изображения"""
     try:
@@ -402,12 +941,13 @@ def delete_image():
         
         # Удаляем файл
         os.remove(file_path)
-        print(f"Файл удален: {file_path}")
+        forget_image(os.path.dirname(file_path), safe_filename)
+        logger.info("Файл удален: %s", file_path)
         
         return jsonify({'success': True, 'message': 'Изображение успешно удалено'})
         
     except Exception as e:
-        print(f"Ошибка при удалении изображения: {e}")
+        logger.exception("Ошибка при удалении изображения")
         return jsonify({'success': False, 'message': f'Ошибка при удалении: {str(e)}'})
 
 @app.route('/admin/reset-password', methods=['POST'])
@@ -436,8 +976,94 @@ def reset_password():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def build_attraction(data, new_id):
+    """Новая достопримечательность из данных формы"""
+    return {
+        'id': new_id,
+        'title': data.get('title', ''),
+        'description': data.get('description', ''),
+        'detailed_description': data.get('detailed_description', ''),
+        'layout': data.get('layout', 'text_left'),
+        'order': data.get('order', new_id),
+        'folder': f"block-{new_id}"
+    }
+
+def apply_attraction_changes(attraction, data):
+    """Изменение полей достопримечательности данными формы"""
+    # Обновляем основные поля
+    for key in ['title', 'description', 'detailed_description', 'layout', 'order']:
+        if key in data:
+            attraction[key] = data[key]
+    
+    # Обновляем VK кнопку только для блока с id=5
+    if attraction['id'] == 5 and 'vk_button' in data:
+        attraction['vk_button'] = data['vk_button']
+    elif attraction['id'] == 5 and 'vk_button' not in attraction:
+        # Если это блок 5 и нет vk_button, создаем по умолчанию
+        attraction['vk_button'] = {
+            'show': False,
+            'text': 'Группа VK',
+            'link': ''
+        }
+
+def remove_attraction_folder(attraction):
+    """Папка удаленной достопримечательности сразу переносится в TRASH_DIR и
+    удаляется с диска фоновым заданием; возвращает id задания или None"""
+    folder_name = attraction.get('folder', '')
+    if not folder_name:
+        return None
+    folder_path = os.path.join(app.static_folder, 'images', 'attraction-block', folder_name)
+    job_id = None
+    if os.path.exists(folder_path):
+        # Новый блок с тем же id получит чистую папку, даже если задание еще не выполнено
+        trash_name = f'{folder_name}-{uuid.uuid4().hex[:8]}'
+        os.makedirs(TRASH_DIR, exist_ok=True)
+        try:
+            os.rename(folder_path, os.path.join(TRASH_DIR, trash_name))
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # TRASH_DIR на другом диске: папка удаляется сразу, без задания
+            logger.warning("TRASH_DIR на другом диске, папка %s удаляется синхронно", folder_path)
+            shutil.rmtree(folder_path)
+        else:
+            job_id = job_queue.submit('remove_folder', name=trash_name)
+    image_catalog.forget(folder_path)
+    image_index.forget(folder_path)
+    return job_id
+
+# Отчет о ходе удаления не чаще, чем через столько файлов
+REMOVE_FOLDER_PROGRESS_STEP = 100
+
+@job_queue.handler('remove_folder')
+def remove_folder_job(job, name):
+    """Задание: удаление папки из TRASH_DIR со всем содержимым"""
+    folder = safe_join(TRASH_DIR, name)
+    if folder is None or os.path.realpath(folder) == os.path.realpath(TRASH_DIR):
+        raise JobError(f"Недопустимая папка: {name}")
+    entries = list(os.walk(folder, topdown=False))
+    total = sum(len(files) for _, _, files in entries)
+    removed = 0
+    for root, dirs, files in entries:
+        for name in files:
+            try:
+                os.remove(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+            removed += 1
+            if removed % REMOVE_FOLDER_PROGRESS_STEP == 0:
+                job.progress(removed, total)
+        for name in dirs:
+            # Ссылки на папки os.walk не обходит
+            if os.path.islink(os.path.join(root, name)):
+                os.remove(os.path.join(root, name))
+        os.rmdir(root)
+    job.progress(removed, total)
+    return {'removed': removed}
+
 @app.route('/admin/attractions', methods=['POST'])
 @login_required
+@invalidates_content
 def create_attraction():
     """Создание новой достопримечательности"""
     try:
@@ -447,44 +1073,114 @@ def create_attraction():
         if not data.get('title'):
             return jsonify({'success': False, 'message': 'Заголовок обязателен'})
         
-        attractions = load_attractions()
-        
-        # Создаем новую достопримечательность
-        new_id = get_next_attraction_id()
+        # id выдается хранилищем внутри той же операции, что и запись
+        try:
+            new_attraction = attractions_repo.create(lambda new_id: build_attraction(data, new_id))
+        except Exception:
+            logger.exception("Ошибка при сохранении достопримечательности")
+            return jsonify({'success': False, 'message': 'Ошибка при сохранении'})
         
         # Создаем папку для изображений
-        folder_name = f"block-{new_id}"
-        
-        new_attraction = {
-            'id': new_id,
-            'title': data.get('title', ''),
-            'description': data.get('description', ''),
-            'detailed_description': data.get('detailed_description', ''),
-            'layout': data.get('layout', 'text_left'),
-            'order': data.get('order', new_id),
-            'folder': folder_name,
-            'images': []  # Изначально нет изображений
-        }
-        
-        attractions.append(new_attraction)
+        new_id = new_attraction['id']
+        os.makedirs(get_attraction_images_dir(new_id), exist_ok=True)
         
-        # Создаем папку для изображений
-        folder_path = os.path.join(app.static_folder, 'images', 'attraction-block', folder_name)
-        os.makedirs(folder_path, exist_ok=True)
-        
-        if save_attractions(attractions):
-            return jsonify({
-                'success': True, 
-                'message': 'Достопримечательность создана',
-                'id': new_id
-            })
-        else:
-            return jsonify({'success': False, 'message': 'Ошибка при сохранении'})
+        return jsonify({
+            'success': True, 
+            'message': 'Достопримечательность создана',
+            'id': new_id
+        })
             
     except Exception as e:
-        print(f"Ошибка при создании достопримечательности: {e}")
+        logger.exception("Ошибка при создании достопримечательности")
         return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
         
+# Поля записи в JSON админ-панели, которые берутся из папки изображений
+ATTRACTION_IMAGE_FIELDS = frozenset({'images', 'images_list', 'images_count'})
+# Все поля, которые можно запросить через ?fields=
+ATTRACTION_FIELDS = frozenset({'id', 'title', 'description', 'detailed_description', 'layout', 'order', 'folder',
+                               'vk_button'}) | ATTRACTION_IMAGE_FIELDS
+
+# Готовые ответы для последних сочетаний fields/ids: (ключ, тело, ETag), не больше ADMIN_ATTRACTION_VIEWS
+ADMIN_ATTRACTION_VIEWS = 32
+admin_attraction_views = OrderedDict()
+admin_attraction_views_lock = threading.Lock()
+
+def parse_list_arg(name):
+    """Список из параметра вида a,b,c или None, если параметра нет"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def project_attraction(attraction, fields, images):
+    """Изменяемая копия записи только с полями fields (все поля, если None)"""
+    if fields is None:
+        record = thaw(attraction)
+        if images is not None:
+            record['images'] = record['images_list'] = images
+        return record
+    record = {field: thaw(attraction[field]) for field in fields if field in attraction}
+    if images is not None:
+        for field in fields & {'images', 'images_list'}:
+            record[field] = images
+        if 'images_count' in fields:
+            record['images_count'] = len(images)
+    return record
+
+def admin_attractions_json():
+    """JSON достопримечательностей для админ-панели.
+
+    fields=title,order,images_count — только нужные поля (id всегда),
+    ids=1,2 — только эти записи. Папки изображений читаются один раз на
+    запись и только если запрошено поле с изображениями. Ответы последних
+    ADMIN_ATTRACTION_VIEWS сочетаний кэшируются до изменения контента;
+    неизменившийся ответ отдается как 304.
+    """
+    fields = parse_list_arg('fields')
+    if fields is not None:
+        unknown = set(fields) - ATTRACTION_FIELDS
+        if unknown:
+            return jsonify({'success': False, 'message': f"Неизвестные поля: {', '.join(sorted(unknown))}"}), 400
+        fields = frozenset(fields) | {'id'}
+    ids = parse_list_arg('ids')
+    if ids is not None:
+        try:
+            ids = frozenset(int(attraction_id) for attraction_id in ids)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Некорректный параметр ids'}), 400
+
+    attractions = [attraction for attraction in attractions_repo.ordered()
+                   if ids is None or attraction.get('id') in ids]
+    images = {}
+    if fields is None or not fields.isdisjoint(ATTRACTION_IMAGE_FIELDS):
+        images = {attraction['id']: attractions_repo.images(attraction['id'])
+                  for attraction in attractions if attraction.get('id')}
+
+    # Папки уже перепроверены выше, поэтому поколение каталога актуально
+    key = (render_cache.generation, storage.version(), image_catalog.generation if images else None)
+    view = (fields, ids)
+    with admin_attraction_views_lock:
+        cached = admin_attraction_views.get(view)
+        if cached is not None:
+            admin_attraction_views.move_to_end(view)
+    if cached is None or cached[0] != key:
+        body = app.json.dumps({'success': True, 'attractions': [
+            project_attraction(attraction, fields, images.get(attraction.get('id'))) for attraction in attractions
+        ]}).encode('utf-8')
+        cached = (key, body, hashlib.sha256(body).hexdigest()[:32])
+        with admin_attraction_views_lock:
+            admin_attraction_views[view] = cached
+            admin_attraction_views.move_to_end(view)
+            while len(admin_attraction_views) > ADMIN_ATTRACTION_VIEWS:
+                admin_attraction_views.popitem(last=False)
+    _, body, etag = cached
+
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Браузер сам переспрашивает с If-None-Match и получает 304, если ничего не менялось
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @app.route('/admin/attractions', methods=['GET'])
 @login_required
 def admin_attractions():
@@ -492,18 +1188,9 @@ def admin_attractions():
     if 'application/json' in request.headers.get('Accept', '') or request.args.get('format') == 'json':
         # Если клиент хочет JSON
         try:
-            attractions = load_attractions()
-            attractions.sort(key=lambda x: x.get('order', 0))
-            
-            for attraction in attractions:
-                attraction_id = attraction.get('id')
-                if attraction_id:
-                    # Получаем изображения из папки
-                    attraction['images_list'] = get_attraction_images(attraction_id)
-            
-            return jsonify({'success': True, 'attractions': attractions})
+            return admin_attractions_json()
         except Exception as e:
-            print(f"Ошибка при загрузке достопримечательностей: {e}")
+            logger.exception("Ошибка при загрузке достопримечательностей")
             return jsonify({'success': False, 'message': f'Ошибка сервера: {str(e)}'}), 500
     else:
         # Иначе возвращаем HTML страницу
@@ -512,73 +1199,51 @@ def admin_attractions():
 
 @app.route('/admin/attractions/<int:attraction_id>', methods=['PUT'])
 @login_required
+@invalidates_content
 def update_attraction(attraction_id):
     """Обновление достопримечательности"""
     try:
-        attractions = load_attractions()
         data = request.get_json()
         
-        # Находим достопримечательность
-        for i, attraction in enumerate(attractions):
-            if attraction['id'] == attraction_id:
-                # Обновляем основные поля
-                for key in ['title', 'description', 'detailed_description', 'layout', 'order']:
-                    if key in data:
-                        attractions[i][key] = data[key]
-                
-                # Обновляем VK кнопку только для блока с id=5
-                if attraction_id == 5 and 'vk_button' in data:
-                    attractions[i]['vk_button'] = data['vk_button']
-                elif attraction_id == 5 and 'vk_button' not in attractions[i]:
-                    # Если это блок 5 и нет vk_button, создаем по умолчанию
-                    attractions[i]['vk_button'] = {
-                        'show': False,
-                        'text': 'Группа VK',
-                        'link': ''
-                    }
-                
-                if save_attractions(attractions):
-                    return jsonify({'success': True, 'message': 'Достопримечательность обновлена'})
-                else:
-                    return jsonify({'success': False, 'message': 'Ошибка при сохранении'})
-        
-        return jsonify({'success': False, 'message': 'Достопримечательность не найдена'})
+        try:
+            updated = attractions_repo.update(attraction_id, lambda attraction: apply_attraction_changes(attraction, data))
+        except Exception:
+            logger.exception("Ошибка при сохранении достопримечательности")
+            return jsonify({'success': False, 'message': 'Ошибка при сохранении'})
+        
+        if updated is None:
+            return jsonify({'success': False, 'message': 'Достопримечательность не найдена'})
+        return jsonify({'success': True, 'message': 'Достопримечательность обновлена'})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
 
 @app.route('/admin/attractions/<int:attraction_id>', methods=['DELETE'])
 @login_required
+@invalidates_content
 def delete_attraction(attraction_id):
     """Удаление достопримечательности"""
     try:
-        attractions = load_attractions()
-        
-        # Находим достопримечательность
-        for i, attraction in enumerate(attractions):
-            if attraction['id'] == attraction_id:
-                # Удаляем папку с изображениями
-                folder_name = attraction.get('folder', '')
-                if folder_name:
-                    folder_path = os.path.join(app.static_folder, 'images', 'attraction-block', folder_name)
-                    if os.path.exists(folder_path):
-                        shutil.rmtree(folder_path)
-                
-                # Удаляем из списка
-                del attractions[i]
-                
-                if save_attractions(attractions):
-                    return jsonify({'success': True, 'message': 'Достопримечательность удалена'})
-                else:
-                    return jsonify({'success': False, 'message': 'Ошибка при сохранении'})
-        
-        return jsonify({'success': False, 'message': 'Достопримечательность не найдена'})
+        try:
+            attraction = attractions_repo.delete(attraction_id)
+        except Exception:
+            logger.exception("Ошибка при удалении достопримечательности")
+            return jsonify({'success': False, 'message': 'Ошибка при сохранении'})
+        
+        if attraction is None:
+            return jsonify({'success': False, 'message': 'Достопримечательность не найдена'})
+        
+        # Папка с изображениями удаляется в фоне
+        job_id = remove_attraction_folder(attraction)
+        
+        return jsonify({'success': True, 'message': 'Достопримечательность удалена', 'job': job_id})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
 
 @app.route('/admin/attractions/order', methods=['POST'])
 @login_required
+@invalidates_content
 def update_attractions_order():
     """Обновление порядка достопримечательностей"""
     try:
@@ -588,26 +1253,129 @@ def update_attractions_order():
         if not new_order:
             return jsonify({'success': False, 'message': 'Не указан порядок'})
         
-        attractions = load_attractions()
+        try:
+            attractions_repo.reorder(new_order)
+        except Exception:
+            logger.exception("Ошибка при сохранении порядка")
+            return jsonify({'success': False, 'message': 'Ошибка при сохранении'})
         
-        # Обновляем порядок
+        return jsonify({'success': True, 'message': 'Порядок обновлен'})
+            
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
+
+# Пакет изменений контента: не больше операций в одном запросе
+CONTENT_BATCH_MAX_OPERATIONS = 200
+
+def find_attraction(attractions, attraction_id):
+    for attraction in attractions:
+        if attraction.get('id') == attraction_id:
+            return attraction
+    raise StorageError(f'Достопримечательность {attraction_id} не найдена')
+
+def apply_content_operation(page_data, attractions, allocate_id, operation):
+    """Одна операция пакета над копиями данных; результат операции для ответа"""
+    if not isinstance(operation, dict):
+        raise StorageError('Операция должна быть объектом')
+    op = operation.get('op')
+
+    if op == 'update_section':
+        section = operation.get('section')
+        fields = operation.get('fields')
+        if not section:
+            raise StorageError('Не указан раздел (section)')
+        if not fields or not isinstance(fields, dict):
+            raise StorageError('Не указаны поля для обновления (fields)')
+        if section == 'stats':
+            raise StorageError('Раздел статистики удален')
+        page_data.setdefault(section, {}).update(fields)
+        return {'op': op, 'section': section}
+
+    if op == 'create_attraction':
+        data = operation.get('data') or {}
+        if not data.get('title'):
+            raise StorageError('Заголовок обязателен')
+        new_id = allocate_id()
+        attractions.append(build_attraction(data, new_id))
+        return {'op': op, 'id': new_id}
+
+    if op == 'update_attraction':
+        attraction = find_attraction(attractions, operation.get('id'))
+        apply_attraction_changes(attraction, operation.get('data') or {})
+        return {'op': op, 'id': attraction['id']}
+
+    if op == 'delete_attraction':
+        attraction = find_attraction(attractions, operation.get('id'))
+        attractions.remove(attraction)
+        return {'op': op, 'id': attraction['id'], 'folder': attraction.get('folder', '')}
+
+    if op == 'reorder':
+        order = operation.get('order')
+        if not order or not isinstance(order, list):
+            raise StorageError('Не указан порядок')
+        positions = {attraction_id: position for position, attraction_id in enumerate(order, 1)}
         for attraction in attractions:
-            if attraction['id'] in new_order:
-                attraction['order'] = new_order.index(attraction['id']) + 1
+            if attraction.get('id') in positions:
+                attraction['order'] = positions[attraction['id']]
+        attractions.sort(key=lambda x: x.get('order', 0))
+        return {'op': op}
+
+    raise StorageError(f'Неизвестная операция: {op}')
+
+@app.route('/admin/batch', methods=['POST'])
+@login_required
+def apply_content_batch():
+    """Пакет изменений контента одним запросом.
+
+    Операции применяются по порядку к одному снимку данных. Если хотя бы
+    одна не проходит проверку, не сохраняется ничего; иначе данные
+    записываются один раз.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        operations = data.get('operations')
         
-        # Сортируем по новому порядку
-        attractions.sort(key=lambda x: x['order'])
+        if not operations or not isinstance(operations, list):
+            return jsonify({'success': False, 'message': 'Не указаны операции (operations)'})
         
-        if save_attractions(attractions):
-            return jsonify({'success': True, 'message': 'Порядок обновлен'})
-        else:
+        if len(operations) > CONTENT_BATCH_MAX_OPERATIONS:
+            return jsonify({'success': False, 'message': f'Слишком много операций. Максимум за раз: {CONTENT_BATCH_MAX_OPERATIONS}'})
+        
+        def apply(page_data, attractions, allocate_id):
+            results = []
+            for index, operation in enumerate(operations, 1):
+                try:
+                    results.append(apply_content_operation(page_data, attractions, allocate_id, operation))
+                except StorageError as e:
+                    raise StorageError(f'Операция {index}: {e}')
+            return results
+        
+        try:
+            results = storage.apply_batch(apply)
+        except StorageError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        except Exception:
+            logger.exception("Ошибка при сохранении пакета изменений")
             return jsonify({'success': False, 'message': 'Ошибка при сохранении'})
-            
+        # Отклоненный пакет ничего не меняет: готовые страницы сбрасываются только здесь
+        render_cache.bump()
+        
+        # Файлы трогаем только после того, как данные сохранены
+        for result in results:
+            if result['op'] == 'create_attraction':
+                os.makedirs(get_attraction_images_dir(result['id']), exist_ok=True)
+            elif result['op'] == 'delete_attraction':
+                result['job'] = remove_attraction_folder(result)
+        
+        return jsonify({'success': True, 'message': f'Применено операций: {len(results)}', 'results': results})
+        
     except Exception as e:
-        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
+        logger.exception("Ошибка в apply_content_batch")
+        return jsonify({'success': False, 'message': f'Внутренняя ошибка сервера: {str(e)}'})
 
 @app.route('/admin/attractions/<int:attraction_id>/images', methods=['POST'])
 @login_required
+@invalidates_content
 def upload_attraction_image(attraction_id):
     """Загрузка изображения для достопримечательности"""
     try:
@@ -619,49 +1387,59 @@ def upload_attraction_image(attraction_id):
         if file.filename == '':
             return jsonify({'success': False, 'message': 'Файл не выбран'})
         
-        # Проверка размера
-        file.seek(0, 2)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({'success': False, 'message': 'Файл слишком большой'})
-        
         # Проверка расширения
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'message': 'Неподдерживаемый формат'})
         
-        # Создаем безопасное имя файла
-        original_filename = secure_filename(file.filename)
-        name, ext = os.path.splitext(original_filename)
-        unique_filename = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
-        
-        # Сохраняем файл в папку блока
-        folder_name = f"block-{attraction_id}"
-        upload_folder = os.path.join(app.static_folder, 'images', 'attraction-block', folder_name)
-        os.makedirs(upload_folder, exist_ok=True)
+        # Потоково сохраняем файл в папку блока
+        upload_folder = get_attraction_images_dir(attraction_id)
+        try:
+            stored = store_upload(file, upload_folder)
+        except UploadError as e:
+            return jsonify({'success': False, 'message': str(e)})
         
+        unique_filename, file_size = stored.filename, stored.size
         file_path = os.path.join(upload_folder, unique_filename)
-        file.save(file_path)
+        job_id = register_upload(upload_folder, stored)
         
-        print(f"Изображение сохранено в папку: {file_path}")
+        logger.info("Изображение сохранено в папку: %s", file_path)
         
         return jsonify({
             'success': True, 
             'message': 'Изображение загружено',
-            'filename': unique_filename
+            'filename': unique_filename,
+            'size': file_size,
+            'duplicate': stored.duplicate,
+            'job': job_id
         })
         
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"Ошибка при загрузке изображения: {e}")
+        logger.exception("Ошибка при загрузке изображения")
         return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
 
+@app.route('/admin/attractions/<int:attraction_id>/images/batch', methods=['POST'])
+@login_required
+@invalidates_content
+def upload_attraction_images_batch(attraction_id):
+    """Пакетная загрузка изображений достопримечательности"""
+    try:
+        upload_folder = get_attraction_images_dir(attraction_id)
+        return batch_upload_response(upload_folder, f'images/attraction-block/block-{attraction_id}')
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.exception("Ошибка при пакетной загрузке изображений")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}', 'results': []})
+
 @app.route('/admin/attractions/<int:attraction_id>/images/delete', methods=['POST'])
 @login_required
+@invalidates_content
 def delete_attraction_image(attraction_id):
     """Удаление изображения достопримечательности (POST метод)"""
     try:
-        print(f"DEBUG: Удаление изображения для достопримечательности {attraction_id}")
+        logger.debug("Удаление изображения для достопримечательности %s", attraction_id)
         
         # Получаем данные из JSON тела запроса
         data = request.get_json()
@@ -669,90 +1447,189 @@ def delete_attraction_image(attraction_id):
             return jsonify({'success': False, 'message': 'Не указано имя файла'})
         
         filename = data.get('filename')
-        print(f"DEBUG: Имя файла для удаления: {filename}")
+        logger.debug("Имя файла для удаления: %s", filename)
         
         # Получаем папку для достопримечательности из JSON
-        attractions = load_attractions()
-        folder_name = None
-        
-        for attraction in attractions:
-            if attraction['id'] == attraction_id:
-                folder_name = attraction.get('folder')
-                print(f"DEBUG: Найдена папка в JSON: {folder_name}")
-                break
+        attraction = attractions_repo.get(attraction_id)
+        folder_name = attraction.get('folder') if attraction else None
+        if folder_name:
+            logger.debug("Найдена папка в JSON: %s", folder_name)
         
         # Если папка не найдена в JSON, создаем имя по умолчанию
         if not folder_name:
             folder_name = f"block-{attraction_id}"
-            print(f"DEBUG: Используем папку по умолчанию: {folder_name}")
+            logger.debug("Используем папку по умолчанию: %s", folder_name)
         
         # Безопасное имя файла
         safe_filename = secure_filename(filename)
-        print(f"DEBUG: Безопасное имя файла: {safe_filename}")
+        logger.debug("Безопасное имя файла: %s", safe_filename)
         
         # Удаляем файл
         file_path = os.path.join(app.static_folder, 'images', 'attraction-block', folder_name, safe_filename)
-        print(f"DEBUG: Полный путь к файлу: {file_path}")
-        print(f"DEBUG: Существует ли файл: {os.path.exists(file_path)}")
+        logger.debug("Полный путь к файлу: %s", file_path)
         
         if os.path.exists(file_path):
             os.remove(file_path)
-            print(f"Изображение удалено: {file_path}")
+            forget_image(os.path.dirname(file_path), safe_filename)
+            logger.info("Изображение удалено: %s", file_path)
             return jsonify({'success': True, 'message': 'Изображение удалено'})
         else:
             # Проверяем альтернативные варианты имени файла
-            print(f"DEBUG: Файл не найден. Проверяем альтернативные варианты...")
+            logger.debug("Файл не найден. Проверяем альтернативные варианты...")
             
             # Проверяем оригинальное имя файла
             alt_path = os.path.join(app.static_folder, 'images', 'attraction-block', folder_name, filename)
             if os.path.exists(alt_path):
                 os.remove(alt_path)
+                forget_image(os.path.dirname(alt_path), filename)
                 return jsonify({'success': True, 'message': 'Изображение удалено (оригинальное имя)'})
             
             # Список файлов в папке для отладки
             folder_path = os.path.join(app.static_folder, 'images', 'attraction-block', folder_name)
-            if os.path.exists(folder_path):
-                files_in_folder = os.listdir(folder_path)
-                print(f"DEBUG: Файлы в папке {folder_path}: {files_in_folder}")
+            if logger.isEnabledFor(logging.DEBUG) and os.path.exists(folder_path):
+                logger.debug("Файлы в папке %s: %s", folder_path, os.listdir(folder_path))
             
             return jsonify({'success': False, 'message': f'Файл не найден: {safe_filename}'})
             
     except Exception as e:
-        print(f"Ошибка при удалении изображения: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Ошибка при удалении изображения")
         return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
         
+# Поля элемента /gallery-data, которые можно запросить через ?fields=
+GALLERY_DATA_FIELDS = ('path', 'alt', 'filename', 'size', 'variants', 'width', 'height', 'placeholder')
+GALLERY_PAGE_MAX_LIMIT = 100
+GALLERY_DATA_MAX_AGE = 60
+GALLERY_DATA_STALE_WHILE_REVALIDATE = 300
+
+def encode_gallery_cursor(filename):
+    return base64.urlsafe_b64encode(filename.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_gallery_cursor(cursor):
+    """Имя файла, после которого продолжается выдача; ValueError для некорректного курсора"""
+    try:
+        return base64.b64decode(cursor + '=' * (-len(cursor) % 4), altchars=b'-_', validate=True).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError('Некорректный курсор')
+
+def parse_gallery_query(args):
+    """Параметры limit, cursor и fields запроса /gallery-data"""
+    limit = args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= GALLERY_PAGE_MAX_LIMIT:
+            raise ValueError(f'limit должен быть числом от 1 до {GALLERY_PAGE_MAX_LIMIT}')
+        limit = int(limit)
+
+    cursor = args.get('cursor')
+    after = decode_gallery_cursor(cursor) if cursor else None
+
+    fields = GALLERY_DATA_FIELDS
+    if args.get('fields'):
+        fields = tuple(field.strip() for field in args['fields'].split(',') if field.strip())
+        unknown = [field for field in fields if field not in GALLERY_DATA_FIELDS]
+        if unknown or not fields:
+            raise ValueError(f'Неизвестные поля: {", ".join(unknown) or "пусто"}')
+    return limit, after, fields
+
+def gallery_data_etag(images_dir, entries, start, page, limit, fields):
+    """Слабый ETag /gallery-data до построения ответа: запрос, записи каталога и
+    их записи в манифесте копий. Все это одинаково во всех процессах"""
+    manifest = image_variants.get_folder_variants(images_dir)
+    digest = hashlib.sha256(repr((limit, start, len(entries), fields)).encode('utf-8'))
+    for entry in page:
+        digest.update(repr((entry.name, entry.size, entry.modified, manifest.get(entry.name))).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
 # Маршруты для галереи (эти маршруты должны быть публичными)
 @app.route('/gallery-data')
 def get_gallery_data():
-    """Получение данных галереи для главной страницы"""
+    """Получение данных галереи для главной страницы.
+
+    Без параметров возвращает все изображения. ?limit=N&cursor=... отдает
+    страницу, продолжая после файла из курсора (каталог отсортирован по
+    имени, поэтому удаление или добавление файлов не сдвигает выдачу).
+    ?fields=path,variants оставляет в элементах только нужные поля.
+    """
     try:
-        images_info = get_gallery_images()
-        
-        # Формируем данные для галереи
+        limit, after, fields = parse_gallery_query(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e), 'images': []}), 400
+
+    try:
+        images_dir = get_gallery_dir()
+        entries = image_catalog.list(images_dir)
+        start = bisect.bisect_right(entries, after, key=lambda entry: entry.name) if after is not None else 0
+        page = entries[start:start + limit] if limit is not None else entries[start:]
+        has_more = start + len(page) < len(entries)
+
+        # Неизменившаяся страница отдается как 304 без описания изображений и сериализации
+        etag = gallery_data_etag(images_dir, entries, start, page, limit, fields)
+        cache_control = (f'public, max-age={GALLERY_DATA_MAX_AGE}, '
+                         f'stale-while-revalidate={GALLERY_DATA_STALE_WHILE_REVALIDATE}')
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+        # Копии описываются только для изображений текущей страницы
         gallery_data = []
-        for img_info in images_info:
-            gallery_data.append({
-                'path': img_info['path'],
-                'alt': f'Фотография парка {img_info["filename"]}',
-                'filename': img_info['filename'],
-                'size': img_info['size']
-            })
-        
-        return jsonify({
+        for entry in page:
+            img_info = describe_gallery_image(images_dir, entry)
+            img_info['alt'] = f'Фотография парка {entry.name}'
+            gallery_data.append({field: img_info[field] for field in fields})
+
+        response = jsonify({
             'success': True,
             'images': gallery_data,
-            'count': len(gallery_data)
+            'count': len(gallery_data),
+            'total': len(entries),
+            'next_cursor': encode_gallery_cursor(page[-1].name) if has_more and page else None
         })
-    except Exception as e:
-        print(f"Ошибка при получении данных галереи: {e}")
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = cache_control
+        return response
+    except Exception:
+        logger.exception("Ошибка при получении данных галереи")
         return jsonify({
             'success': False,
             'message': 'Ошибка загрузки галереи',
             'images': []
         })
 
+# Статический экспорт публичных страниц для раздачи через nginx (см. команду export-static).
+# Если задана папка DOLINA_EXPORT_DIR, экспорт обновляется в фоне после каждого изменения контента
+EXPORT_DIR = os.environ.get('DOLINA_EXPORT_DIR')
+# Размеры страниц галереи, которые запрашивает script.js (GalleryManager.pageSize)
+EXPORT_GALLERY_PAGE_SIZES = (12,)
+
+def render_export_pages():
+    """Страницы статического экспорта: путь в папке экспорта -> байты"""
+    with app.test_request_context('/'):
+        pages = {'index.html': render_index()}
+    with app.test_request_context('/gallery-data'):
+        pages['gallery-data/all.json'] = get_gallery_data().get_data()
+    # Постраничная выдача: первая страница и по файлу на каждый курсор
+    for page_size in EXPORT_GALLERY_PAGE_SIZES:
+        cursor = None
+        while True:
+            query = {'limit': page_size}
+            if cursor:
+                query['cursor'] = cursor
+            with app.test_request_context('/gallery-data', query_string=query):
+                response = get_gallery_data()
+            pages[f'gallery-data/{page_size}/{cursor or "first"}.json'] = response.get_data()
+            cursor = response.get_json().get('next_cursor')
+            if not cursor:
+                break
+    return pages
+
+static_export = (StaticExport(EXPORT_DIR, app.static_folder, render_export_pages, static_precompressed)
+                 if EXPORT_DIR else None)
+if static_export is not None:
+    render_cache.on_bump(static_export.schedule)
+    # При запуске догоняем изменения, сделанные, пока приложение не работало
+    static_export.schedule()
+
 # Маршруты для управления галереей (требуют авторизации)
 @app.route('/admin/gallery')
 @login_required
@@ -768,11 +1645,12 @@ def admin_gallery_data():  # Изменено имя функции
         images_info = get_gallery_images()
         return jsonify({'success': True, 'images': images_info})
     except Exception as e:
-        print(f"Ошибка при загрузке галереи: {e}")
+        logger.exception("Ошибка при загрузке галереи")
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/admin/gallery/upload', methods=['POST'])
 @login_required
+@invalidates_content
 def upload_gallery_image():
     """Загрузка изображения в галерею"""
     try:
@@ -784,48 +1662,56 @@ def upload_gallery_image():
         if file.filename == '':
             return jsonify({'success': False, 'message': 'Файл не выбран'})
         
-        # Проверка размера файла
-        file.seek(0, 2)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({'success': False, 'message': f'Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // (1024*1024)}MB'})
-        
         # Проверка расширения файла
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'message': 'Неподдерживаемый формат файла. Разрешенные форматы: PNG, JPG, JPEG, GIF, WEBP'})
         
-        # Создаем безопасное имя файла
-        original_filename = secure_filename(file.filename)
-        name, ext = os.path.splitext(original_filename)
-        
-        # Генерируем уникальное имя файла
-        unique_filename = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
-        
-        # Создаем папку, если ее нет
+        # Потоково сохраняем файл под уникальным именем
         upload_folder = os.path.join(app.static_folder, 'images', GALLERY_FOLDER)
-        os.makedirs(upload_folder, exist_ok=True)
+        try:
+            stored = store_upload(file, upload_folder)
+        except UploadError as e:
+            return jsonify({'success': False, 'message': str(e)})
         
-        # Сохраняем файл
+        unique_filename, file_size = stored.filename, stored.size
         file_path = os.path.join(upload_folder, unique_filename)
-        file.save(file_path)
+        job_id = register_upload(upload_folder, stored)
         
-        print(f"Файл сохранен в галерею: {file_path}")
+        logger.info("Файл сохранен в галерею: %s", file_path)
         
         return jsonify({
             'success': True, 
             'message': 'Изображение успешно загружено в галерею',
             'filename': unique_filename,
-            'path': f"images/{GALLERY_FOLDER}/{unique_filename}"
+            'path': f"images/{GALLERY_FOLDER}/{unique_filename}",
+            'size': file_size,
+            'duplicate': stored.duplicate,
+            'job': job_id
         })
         
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"Ошибка при загрузке изображения в галерею: {e}")
+        logger.exception("Ошибка при загрузке изображения в галерею")
         return jsonify({'success': False, 'message': f'Ошибка при загрузке: {str(e)}'})
 
+@app.route('/admin/gallery/upload-batch', methods=['POST'])
+@login_required
+@invalidates_content
+def upload_gallery_images_batch():
+    """Пакетная загрузка изображений в галерею"""
+    try:
+        upload_folder = os.path.join(app.static_folder, 'images', GALLERY_FOLDER)
+        return batch_upload_response(upload_folder, f'images/{GALLERY_FOLDER}')
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.exception("Ошибка при пакетной загрузке в галерею")
+        return jsonify({'success': False, 'message': f'Ошибка при загрузке: {str(e)}', 'results': []})
+
 @app.route('/admin/gallery/delete', methods=['POST'])
 @login_required
+@invalidates_content
 def delete_gallery_image():
     """Удаление изображения из галереи"""
     try:
@@ -847,14 +1733,188 @@ def delete_gallery_image():
         
         # Удаляем файл
         os.remove(file_path)
-        print(f"Файл удален из галереи: {file_path}")
+        forget_image(os.path.dirname(file_path), safe_filename)
+        logger.info("Файл удален из галереи: %s", file_path)
         
         return jsonify({'success': True, 'message': 'Изображение успешно удалено из галереи'})
         
     except Exception as e:
-        print(f"Ошибка при удалении изображения из галереи: {e}")
+        logger.exception("Ошибка при удалении изображения из галереи")
         return jsonify({'success': False, 'message': f'Ошибка при удалении: {str(e)}'})
 
+def iter_image_folders():
+    """Все папки с изображениями, для которых строятся адаптивные копии"""
+    images_root = os.path.join(app.static_folder, 'images')
+    yield os.path.join(images_root, 'hero-section')
+    yield os.path.join(images_root, GALLERY_FOLDER)
+    attractions_root = os.path.join(images_root, 'attraction-block')
+    if os.path.isdir(attractions_root):
+        for entry in sorted(os.scandir(attractions_root), key=lambda e: e.name):
+            # Скрытые служебные папки блоками не считаются
+            if entry.is_dir() and not entry.name.startswith('.'):
+                yield entry.path
+
+@app.cli.command('build-image-variants')
+@click.option('--force', is_flag=True, help='Пересоздать копии, даже если они актуальны')
+def build_image_variants_command(force):
+    """Создание адаптивных копий (WebP/JPEG по ширинам) и заглушек для уже загруженных изображений"""
+    if not image_variants.variants_available():
+        raise click.ClickException('Для создания копий нужен Pillow (pip install Pillow)')
+    
+    created = skipped = failed = 0
+    for folder in iter_image_folders():
+        if not os.path.isdir(folder):
+            continue
+        for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+            if not entry.is_file() or not allowed_file(entry.name):
+                continue
+            if not force and image_variants.is_up_to_date(folder, entry.name):
+                # Копии актуальны, но манифест записан до появления заглушек
+                if not image_variants.has_placeholder(folder, entry.name):
+                    try:
+                        image_variants.generate_placeholder(folder, entry.name)
+                        click.echo(f"  ~ {os.path.relpath(entry.path, app.static_folder)}")
+                    except Exception as e:
+                        failed += 1
+                        click.echo(f"  ! {os.path.relpath(entry.path, app.static_folder)}: {e}", err=True)
+                        continue
+                skipped += 1
+                continue
+            try:
+                image_variants.generate_variants(folder, entry.name)
+                created += 1
+                click.echo(f"  + {os.path.relpath(entry.path, app.static_folder)}")
+            except Exception as e:
+                failed += 1
+                click.echo(f"  ! {os.path.relpath(entry.path, app.static_folder)}: {e}", err=True)
+    
+    render_cache.bump()
+    click.echo(f"Готово: создано {created}, актуальных {skipped}, ошибок {failed}")
+
+@app.cli.command('reconcile-images')
+def reconcile_images_command():
+    """Сверка индекса метаданных изображений с файлами (после ручного копирования или удаления)"""
+    for folder in iter_image_folders():
+        if not os.path.isdir(folder):
+            continue
+        added, updated, removed = image_index.reconcile(folder)
+        files = image_index.files(folder) or {}
+        hashes = [meta['sha256'] for meta in files.values()]
+        duplicates = len(hashes) - len(set(hashes))
+        click.echo(f"  {os.path.relpath(folder, app.static_folder)}: файлов {len(files)}, добавлено {added}, "
+                   f"обновлено {updated}, удалено {removed}" + (f", повторов {duplicates}" if duplicates else ''))
+    render_cache.bump()
+    click.echo("Готово")
+
+@app.cli.command('build-fonts')
+@click.option('--scan/--no-scan', default=True, help='Добавить символы из шаблонов, скриптов и контента')
+@click.option('--preload', multiple=True, default=PRELOAD_FONT_FAMILIES, show_default=True,
+              help='Семейства, кириллическая часть которых предзагружается на главной')
+def build_fonts_command(scan, preload):
+    """Сборка WOFF2-подмножеств шрифтов с unicode-range и правилами @font-face"""
+    faces = font_build.parse_font_faces(os.path.join(app.static_folder, font_build.FONTS_SOURCE_STYLESHEET))
+    
+    texts = []
+    if scan:
+        for folder, names in ((app.template_folder, os.listdir(app.template_folder)), 
+                              (os.path.join(app.static_folder, 'js'), os.listdir(os.path.join(app.static_folder, 'js')))):
+            for name in names:
+                if name.endswith(('.html', '.js')):
+                    with open(os.path.join(folder, name), 'r', encoding='utf-8') as f:
+                        texts.append(f.read())
+        texts.append(json.dumps(thaw(get_page_data_snapshot()), ensure_ascii=False))
+        texts.append(json.dumps(thaw(get_attractions_snapshot()), ensure_ascii=False))
+    
+    try:
+        manifest = font_build.build_fonts(app.static_folder, faces, font_build.collect_codepoints(texts), preload)
+    except font_build.FontBuildError as e:
+        raise click.ClickException(str(e))
+    
+    # URL шрифтов в fonts.css с отпечатками: файлы кэшируются браузером навсегда
+    css_dir = os.path.dirname(font_build.FONTS_STYLESHEET)
+    def font_url(path):
+        return f"{os.path.relpath(path, css_dir)}?v={asset_fingerprints.get(path)}"
+    
+    stylesheet_path = os.path.join(app.static_folder, font_build.FONTS_STYLESHEET)
+    with open(stylesheet_path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(font_build.render_stylesheet(manifest['rules'], font_url))
+    os.replace(stylesheet_path + '.tmp', stylesheet_path)
+    write_json_atomic(os.path.join(app.static_folder, font_build.FONTS_MANIFEST), manifest)
+    
+    for path in manifest['files']:
+        size = os.path.getsize(os.path.join(app.static_folder, path))
+        click.echo(f"  {path}: {size // 1024} KB")
+    click.echo(f"Правила записаны в {font_build.FONTS_STYLESHEET}, предзагрузка: {len(manifest['preload'])}")
+
+@app.cli.command('compress-static')
+@click.option('--force', is_flag=True, help='Пересжать все файлы, даже актуальные')
+def compress_static_command(force):
+    """Создание сжатых копий (.br/.gz) для текстовой статики"""
+    written, checked = static_precompressed.compress_all(force=force)
+    click.echo(f"Просмотрено файлов: {checked}, записано сжатых копий: {written}")
+
+@app.cli.command('export-static')
+@click.argument('target', required=False)
+def export_static_command(target):
+    """Статическая копия главной страницы, JSON галереи и статики для nginx"""
+    target = target or EXPORT_DIR
+    if not target:
+        raise click.ClickException('Укажите папку экспорта аргументом или переменной DOLINA_EXPORT_DIR')
+    stats = StaticExport(target, app.static_folder, render_export_pages, static_precompressed).export()
+    click.echo(f"Страниц записано: {stats['pages_written']}, удалено: {stats['pages_removed']}; "
+               f"файлов статики обновлено: {stats['files_updated']}, удалено: {stats['files_removed']}")
+
+@app.cli.command('storage-import-json')
+@click.option('--force', is_flag=True, help='Перезаписать непустую базу')
+def storage_import_json_command(force):
+    """Перенос page_data.json и attractions_data.json в базу SQLite"""
+    target = SqliteStorage(SQLITE_FILE, CONTENT_CACHE_CHECK_INTERVAL_MS)
+    if not target.is_empty() and not force:
+        raise click.ClickException(f'База {SQLITE_FILE} уже содержит данные (используйте --force)')
+    
+    source = JsonStorage(DATA_FILE, ATTRACTIONS_FILE, CONTENT_CACHE_CHECK_INTERVAL_MS)
+    sections, attractions = target.import_from(source)
+    click.echo(f"Перенесено разделов: {sections}, достопримечательностей: {attractions} -> {SQLITE_FILE}")
+    click.echo("Включите хранилище переменной окружения DOLINA_STORAGE=sqlite")
+
+def preload_content():
+    """Прогрев кэшей процесса: данные, списки изображений, манифесты, шаблоны и главная страница"""
+    storage.get_page_data()
+    attractions_repo.ordered()
+    for folder in iter_image_folders():
+        image_catalog.list(folder)
+        image_variants.get_folder_variants(folder)
+    font_manifest_cache.get()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    with app.test_request_context('/'):
+        key = get_index_cache_key()
+        if render_cache.get('index', key) is None:
+            cache_index_page(key)
+
+def expire_content_caches():
+    """Сброс кэшей после изменения контента в другом процессе (см. serve.py)"""
+    storage.expire()
+    image_index.expire()
+    image_catalog.expire()
+    image_variants.expire_manifests()
+    font_manifest_cache.expire()
+    render_cache.bump(notify=False)
+
+def create_app(preload=True):
+    """Приложение для WSGI-сервера (serve.py, gunicorn --preload 'app:create_app()').
+
+    С preload=True кэши заполняются сразу, поэтому при запуске в главном
+    процессе перед fork рабочие процессы получают готовый снимок контента.
+    """
+    if preload:
+        preload_content()
+        # Сжатые копии статики до fork: рабочие процессы не сжимают файлы в ответ на запросы
+        written, _ = static_precompressed.compress_all()
+        if written:
+            logger.info("Обновлено сжатых копий статики: %d", written)
+    return app
+
 if __name__ == '__main__':
     print("Запуск сервера Flask...")
     print(f"Данные хранятся в: {DATA_FILE}")
@@ -866,7 +1926,7 @@ if __name__ == '__main__':
     if hero_images:
         print(f"Найдено {len(hero_images)} изображений для слайдера:")
         for img in hero_images:
-            print(f"  - {img}")
+            print(f"  - {img['path']}")
     else:
         print("ВНИМАНИЕ: В папке static/images/hero-section/ нет изображений!")
         print("Пожалуйста, добавьте изображения в формате jpg, jpeg, png, webp или gif")
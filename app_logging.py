@@ -0,0 +1,138 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+
+# Уровень и формат журнала задаются переменными окружения
+LOG_LEVEL = os.environ.get('DOLINA_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('DOLINA_LOG_FORMAT', 'json')
+
+# Заголовок с id запроса: берется из запроса (если его выставил прокси) и возвращается в ответе
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID_RE = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись журнала — одна строка JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key in ('request_id', 'route', 'method'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Читаемый формат для разработки"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = '-'
+        return super().format(record)
+
+
+class RequestQueueHandler(QueueHandler):
+    """Обработчик, который только кладет запись в очередь.
+
+    В потоке запроса к записи добавляются id запроса и маршрут, текст
+    собирается из аргументов, а трассировка исключения превращается в
+    строку (после выхода из except она уже недоступна). Форматирование
+    в JSON и запись в поток вывода выполняет поток QueueListener.
+    """
+
+    def prepare(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.route = request.url_rule.rule if request.url_rule is not None else request.path
+            record.method = request.method
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogPipeline:
+    """Очередь записей журнала и поток, который пишет их в stderr"""
+
+    def __init__(self, level=LOG_LEVEL, log_format=LOG_FORMAT, stream=None):
+        self.level = level
+        self.formatter = TextFormatter() if log_format == 'text' else JsonFormatter()
+        self.stream = stream
+        self.handler = None
+        self.listener = None
+
+    def start(self):
+        # SimpleQueue без ограничения: поток запроса никогда не ждет на put()
+        log_queue = queue.SimpleQueue()
+        output = logging.StreamHandler(self.stream or sys.stderr)
+        output.setFormatter(self.formatter)
+        self.listener = QueueListener(log_queue, output, respect_handler_level=False)
+        self.handler = RequestQueueHandler(log_queue)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, RequestQueueHandler):
+                root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.listener.start()
+
+    def stop(self):
+        """Остановка с записью всего, что осталось в очереди"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _after_fork(self):
+        # Поток записи не переживает fork: в дочернем процессе заводим свою очередь
+        self.listener = None
+        self.start()
+
+
+def setup_logging(app):
+    """Журнал через очередь, id запроса в g и в заголовке ответа"""
+    pipeline = LogPipeline()
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=pipeline._after_fork)
+
+    @app.before_request
+    def assign_request_id():
+        # Чужой id принимаем только безопасного вида, чтобы он не ломал строки журнала
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = request_id if REQUEST_ID_RE.fullmatch(request_id) else uuid.uuid4().hex[:16]
+
+    @app.after_request
+    def add_request_id_header(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    return pipeline
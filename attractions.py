@@ -0,0 +1,90 @@
+import threading
+from collections import namedtuple
+
+from content_cache import thaw
+
+
+_AttractionIndex = namedtuple('_AttractionIndex', ['version', 'by_id', 'ordered'])
+
+
+class AttractionRepository:
+    """Достопримечательности с индексом по id поверх хранилища.
+
+    Индекс (словарь id -> запись и кортеж, упорядоченный по order)
+    строится один раз на каждую версию хранилища. Записи отдаются
+    неизменяемыми снимками без изображений: список файлов запрашивается
+    через images_loader(id) только тогда, когда он действительно нужен.
+    Записи для индекса читает attractions_loader() (по умолчанию
+    storage.get_attractions). Изменения выполняются операциями
+    хранилища, id выдает его счетчик.
+    """
+
+    def __init__(self, storage, images_loader, attractions_loader=None):
+        self.storage = storage
+        self.images_loader = images_loader
+        self.attractions_loader = attractions_loader or storage.get_attractions
+        self._lock = threading.Lock()
+        self._index = None
+
+    def _current(self):
+        version = self.storage.version()
+        index = self._index
+        if index is not None and index.version == version:
+            return index
+
+        with self._lock:
+            version = self.storage.version()
+            if self._index is None or self._index.version != version:
+                attractions = self.attractions_loader()
+                by_id = {attraction['id']: attraction for attraction in attractions if attraction.get('id')}
+                ordered = tuple(sorted(attractions, key=lambda x: (x.get('order', 0), x.get('id', 0))))
+                self._index = _AttractionIndex(version, by_id, ordered)
+            return self._index
+
+    # Чтение
+
+    def get(self, attraction_id):
+        """Снимок записи или None"""
+        return self._current().by_id.get(attraction_id)
+
+    def ordered(self):
+        """Все записи в порядке order"""
+        return self._current().ordered
+
+    def ids(self):
+        return [attraction['id'] for attraction in self.ordered() if attraction.get('id')]
+
+    def __contains__(self, attraction_id):
+        return attraction_id in self._current().by_id
+
+    def __len__(self):
+        return len(self._current().ordered)
+
+    def images(self, attraction_id):
+        """Имена файлов изображений записи"""
+        return self.images_loader(attraction_id)
+
+    def with_images(self, attraction, key='images'):
+        """Изменяемая копия записи со списком изображений"""
+        attraction = thaw(attraction)
+        if attraction.get('id'):
+            attraction[key] = self.images(attraction['id'])
+        return attraction
+
+    # Изменение
+
+    def create(self, build):
+        """Создание записи: build(new_id) возвращает словарь"""
+        return self.storage.create_attraction(build)
+
+    def update(self, attraction_id, mutate):
+        """Изменение записи функцией mutate(attraction); None, если не найдена"""
+        return self.storage.modify_attraction(attraction_id, mutate)
+
+    def delete(self, attraction_id):
+        """Удаление записи; возвращает удаленную запись или None"""
+        return self.storage.delete_attraction(attraction_id)
+
+    def reorder(self, ordered_ids):
+        """Новый порядок записей по списку id"""
+        self.storage.reorder_attractions(ordered_ids)
@@ -0,0 +1,491 @@
+"""Бенчмарк публичных и админских маршрутов на синтетических данных.
+
+Для каждого масштаба создается временное дерево контента (JSON-данные,
+папки изображений с JPEG реалистичного размера), приложение запускается
+в отдельном процессе с DOLINA_DATA_DIR/DOLINA_STATIC_FOLDER на это
+дерево и измеряется двумя способами: через тестовый клиент Flask
+(без сети) и через настоящий WSGI-сервер с параллельными клиентами.
+
+Результат — JSON с пропускной способностью, p50/p95/p99 и пиковым RSS
+по каждому маршруту; его можно сравнить с сохраненным базовым замером:
+
+    python benchmarks/run.py --scales small,medium --output results.json
+    python benchmarks/run.py --scales small --save-baseline benchmarks/baseline.json
+    python benchmarks/run.py --scales small --baseline benchmarks/baseline.json --fail-on-regression
+"""
+import argparse
+import http.client
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Масштабы: (достопримечательностей, изображений в галерее)
+SCALES = {
+    'small': (10, 10),
+    'medium': (100, 1000),
+    'large': (1000, 10000),
+}
+
+# Маршруты: (имя, путь, нужен ли вход в админ-панель)
+ENDPOINTS = (
+    ('index', '/', False),
+    ('gallery_data', '/gallery-data', False),
+    ('gallery_page', '/gallery-data?limit=24', False),
+    ('admin_attractions', '/admin/attractions?format=json', True),
+    ('static_image', '/static/images/gallery-section/photo-00000.jpg', False),
+)
+
+ADMIN_LOGIN = {'username': 'admin', 'password': 'admin'}
+
+# Размеры исходных фотографий (ширина, высота) для шаблонов JPEG
+PHOTO_SIZES = ((1600, 1067), (1200, 1600), (2400, 1600))
+
+
+# Синтетические данные
+
+def make_jpeg(width, height, rng):
+    """JPEG с шумом и градиентом: по размеру файла похож на фотографию"""
+    from PIL import Image
+
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.frombytes('RGB', (width // 4, height // 4), rng.randbytes((width // 4) * (height // 4) * 3))
+    image = Image.blend(image, noise.resize((width, height)), 0.5)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def fill_folder(folder, count, templates, rng, prefix='photo'):
+    """count изображений в папке: жесткие ссылки на шаблоны (копии, если ссылки недоступны)"""
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        source = rng.choice(templates)
+        target = os.path.join(folder, f'{prefix}-{i:05d}.jpg')
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+
+def generate_dataset(root, attractions, gallery, seed=1):
+    """Дерево контента в root: static/ (копия без изображений + синтетические) и JSON-данные"""
+    rng = random.Random(seed)
+    static_dir = os.path.join(root, 'static')
+    shutil.copytree(os.path.join(ROOT_DIR, 'static'), static_dir,
+                    ignore=shutil.ignore_patterns('images', '*.br', '*.gz'))
+    images_dir = os.path.join(static_dir, 'images')
+    os.makedirs(images_dir)
+    # Логотип и прочие мелкие файлы шаблона нужны как есть
+    for name in os.listdir(os.path.join(ROOT_DIR, 'static', 'images')):
+        if name not in ('hero-section', 'gallery-section', 'attraction-block'):
+            source = os.path.join(ROOT_DIR, 'static', 'images', name)
+            if os.path.isdir(source):
+                shutil.copytree(source, os.path.join(images_dir, name))
+
+    templates_dir = os.path.join(root, 'templates')
+    os.makedirs(templates_dir)
+    templates = []
+    for i, (width, height) in enumerate(PHOTO_SIZES):
+        path = os.path.join(templates_dir, f'template-{i}.jpg')
+        with open(path, 'wb') as f:
+            f.write(make_jpeg(width, height, rng))
+        templates.append(path)
+
+    fill_folder(os.path.join(images_dir, 'hero-section'), 5, templates, rng, 'hero')
+    fill_folder(os.path.join(images_dir, 'gallery-section'), gallery, templates, rng)
+
+    words = ('водопад', 'тропа', 'карелия', 'лес', 'озеро', 'мост', 'скала', 'парк', 'маршрут', 'прогулка')
+    records = []
+    for attraction_id in range(1, attractions + 1):
+        fill_folder(os.path.join(images_dir, 'attraction-block', f'block-{attraction_id}'),
+                    rng.randint(1, 5), templates, rng)
+        records.append({
+            'id': attraction_id,
+            'title': ' '.join(rng.choice(words) for _ in range(3)).capitalize(),
+            'description': ' '.join(rng.choice(words) for _ in range(40)),
+            'detailed_description': ' '.join(rng.choice(words) for _ in range(200)),
+            'layout': rng.choice(('text_left', 'text_right')),
+            'order': attraction_id,
+            'folder': f'block-{attraction_id}',
+        })
+
+    shutil.copyfile(os.path.join(ROOT_DIR, 'page_data.json'), os.path.join(root, 'page_data.json'))
+    with open(os.path.join(root, 'attractions_data.json'), 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+
+    return {
+        'attractions': attractions,
+        'gallery_images': gallery,
+        'template_bytes': [os.path.getsize(path) for path in templates],
+    }
+
+
+# Измерения
+
+def peak_rss_kb():
+    """Пик памяти всего процесса за время его жизни (не отдельного замера)"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На macOS ru_maxrss в байтах, на Linux — в килобайтах
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def current_rss_kb():
+    """Текущий RSS процесса; None, если его не узнать без сторонних пакетов (не Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * resource.getpagesize() // 1024
+
+
+def summarize(latencies, elapsed, errors=0, rss_before=None):
+    rss_after = current_rss_kb()
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, max(0, int(round(p / 100.0 * len(latencies))) - 1))
+        return round(latencies[index] * 1000, 3)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        # Прирост RSS за этот замер; пик процесса — peak_rss_kb в результатах масштаба
+        'rss_growth_kb': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+    }
+
+
+def multipart_body(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            'Content-Type: image/jpeg\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def unique_upload(data, tag):
+    """Копия JPEG с меткой после маркера конца: у каждой загрузки свой sha256,
+    иначе все загрузки после первой отсекаются как повторы"""
+    return data + f'\n{tag}'.encode()
+
+
+def bench_test_client(app_module, requests, upload_data, uploads):
+    """Последовательные запросы через тестовый клиент Flask"""
+    app = app_module.app
+    client = app.test_client()
+    admin = app.test_client()
+    admin.post('/login', data=ADMIN_LOGIN)
+
+    results = {}
+    for name, path, needs_login in ENDPOINTS:
+        current = admin if needs_login else client
+        current.get(path)  # прогрев кэшей
+        latencies, errors = [], 0
+        rss_before = current_rss_kb()
+        started = time.perf_counter()
+        for _ in range(requests):
+            t = time.perf_counter()
+            response = current.get(path)
+            latencies.append(time.perf_counter() - t)
+            errors += response.status_code >= 400
+        results[name] = summarize(latencies, time.perf_counter() - started, errors, rss_before)
+
+    # Главная страница без кэша отрисовки: полная сборка каждый раз
+    latencies, errors = [], 0
+    requests_uncached = max(1, requests // 10)
+    rss_before = current_rss_kb()
+    started = time.perf_counter()
+    for _ in range(requests_uncached):
+        app_module.render_cache.bump()
+        t = time.perf_counter()
+        response = client.get('/')
+        latencies.append(time.perf_counter() - t)
+        errors += response.status_code >= 400
+    results['index_uncached'] = summarize(latencies, time.perf_counter() - started, errors, rss_before)
+
+    latencies, errors = [], 0
+    rss_before = current_rss_kb()
+    started = time.perf_counter()
+    for i in range(uploads):
+        body, content_type = multipart_body('image', f'upload-{i}.jpg', unique_upload(upload_data, f'client-{i}'))
+        t = time.perf_counter()
+        response = admin.post('/admin/gallery/upload', data=body, content_type=content_type)
+        latencies.append(time.perf_counter() - t)
+        errors += response.status_code >= 400 or not response.get_json().get('success')
+    results['upload'] = summarize(latencies, time.perf_counter() - started, errors, rss_before)
+    return results
+
+
+class _Client:
+    """HTTP/1.1 клиент с keep-alive для одного потока"""
+
+    def __init__(self, port, cookie=None):
+        self.port = port
+        self.cookie = cookie
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                return response, data
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def _login_cookie(port):
+    client = _Client(port)
+    body = '&'.join(f'{key}={value}' for key, value in ADMIN_LOGIN.items())
+    response, _ = client.request('POST', '/login', body=body,
+                                 headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    client.close()
+    return response.getheader('Set-Cookie', '').split(';', 1)[0]
+
+
+def _run_concurrent(port, cookie, concurrency, total, make_request):
+    """total запросов из concurrency потоков; make_request(client, i) -> (response, data)"""
+    counter = iter(range(total))
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def worker():
+        client = _Client(port, cookie)
+        local = []
+        try:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    break
+                t = time.perf_counter()
+                try:
+                    response, _ = make_request(client, i)
+                    failed = response.status >= 400
+                except Exception:
+                    failed = True
+                local.append(time.perf_counter() - t)
+                if failed:
+                    with lock:
+                        errors[0] += 1
+        finally:
+            client.close()
+            with lock:
+                latencies.extend(local)
+
+    rss_before = current_rss_kb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return summarize(latencies, time.perf_counter() - started, errors[0], rss_before)
+
+
+def bench_server(app_module, requests, concurrency, upload_data, uploads):
+    """Параллельные клиенты против настоящего WSGI-сервера (werkzeug, потоки)"""
+    from werkzeug.serving import make_server
+
+    # Журнал доступа werkzeug на каждый запрос исказил бы замер
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_port
+    try:
+        cookie = _login_cookie(port)
+        results = {}
+        for name, path, needs_login in ENDPOINTS:
+            session_cookie = cookie if needs_login else None
+            _run_concurrent(port, session_cookie, concurrency, concurrency, lambda c, i: c.request('GET', path))
+            results[name] = _run_concurrent(port, session_cookie, concurrency, requests,
+                                            lambda c, i, path=path: c.request('GET', path))
+
+        def upload(client, i):
+            body, content_type = multipart_body('image', f'server-upload-{i}.jpg',
+                                                unique_upload(upload_data, f'server-{i}'))
+            return client.request('POST', '/admin/gallery/upload', body=body, headers={'Content-Type': content_type})
+
+        results['upload'] = _run_concurrent(port, cookie, concurrency, uploads, upload)
+        return results
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def worker_main(args):
+    """Один масштаб в отдельном процессе: данные, импорт приложения, замеры"""
+    attractions, gallery = SCALES[args.worker]
+    root = tempfile.mkdtemp(prefix=f'dolina-bench-{args.worker}-')
+    try:
+        started = time.perf_counter()
+        dataset = generate_dataset(root, attractions, gallery, seed=args.seed)
+        dataset['generate_seconds'] = round(time.perf_counter() - started, 2)
+
+        os.environ['DOLINA_DATA_DIR'] = root
+        os.environ['DOLINA_STATIC_FOLDER'] = os.path.join(root, 'static')
+        os.environ.setdefault('DOLINA_LOG_LEVEL', 'WARNING')
+        sys.path.insert(0, ROOT_DIR)
+        import app as app_module
+
+        with open(os.path.join(root, 'templates', 'template-0.jpg'), 'rb') as f:
+            upload_data = f.read()
+
+        result = {'dataset': dataset, 'rss_after_import_kb': current_rss_kb() or peak_rss_kb()}
+        if 'client' in args.modes:
+            result['test_client'] = bench_test_client(app_module, args.requests, upload_data, args.uploads)
+        if 'server' in args.modes:
+            result['server'] = bench_server(app_module, args.requests, args.concurrency, upload_data, args.uploads)
+        result['peak_rss_kb'] = peak_rss_kb()
+
+        with open(args.result_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# Сравнение с базовым замером
+
+def compare(results, baseline, tolerance):
+    """Регрессии: p95 выросло или пропускная способность упала больше чем на tolerance"""
+    regressions = []
+    for scale, scale_result in results['scales'].items():
+        for mode in ('test_client', 'server'):
+            for endpoint, current in scale_result.get(mode, {}).items():
+                base = baseline.get('scales', {}).get(scale, {}).get(mode, {}).get(endpoint)
+                if not base:
+                    continue
+                if base.get('p95_ms') and current.get('p95_ms') and current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                    regressions.append(f"{scale}/{mode}/{endpoint}: p95 {base['p95_ms']} -> {current['p95_ms']} мс")
+                if (base.get('throughput_rps') and current.get('throughput_rps') and
+                        current['throughput_rps'] < base['throughput_rps'] * (1 - tolerance)):
+                    regressions.append(f"{scale}/{mode}/{endpoint}: {base['throughput_rps']} -> "
+                                       f"{current['throughput_rps']} запросов/с")
+    return regressions
+
+
+def print_table(results):
+    for scale, scale_result in results['scales'].items():
+        for mode in ('test_client', 'server'):
+            if mode not in scale_result:
+                continue
+            print(f'\n{scale} / {mode} (пик памяти процесса: {scale_result.get("peak_rss_kb", 0) // 1024} МБ)')
+            print(f"{'маршрут':<20}{'запр/с':>10}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'+RSS МБ':>9}{'ошибок':>8}")
+            for endpoint, item in scale_result[mode].items():
+                growth = item.get('rss_growth_kb')
+                growth = f'{growth / 1024:.1f}' if growth is not None else '-'
+                print(f"{endpoint:<20}{item['throughput_rps'] or 0:>10}{item['p50_ms'] or 0:>10}"
+                      f"{item['p95_ms'] or 0:>10}{item['p99_ms'] or 0:>10}{growth:>9}{item['errors']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк маршрутов на синтетических данных')
+    parser.add_argument('--scales', default='small', help='Масштабы через запятую: ' + ', '.join(SCALES))
+    parser.add_argument('--modes', default='client,server', help='client (тестовый клиент), server (WSGI-сервер)')
+    parser.add_argument('--requests', type=int, default=200, help='Запросов на маршрут')
+    parser.add_argument('--concurrency', type=int, default=8, help='Параллельных клиентов для server')
+    parser.add_argument('--uploads', type=int, default=10, help='Загрузок файлов на режим')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Куда сохранить результаты (JSON)')
+    parser.add_argument('--baseline', help='Базовый замер для сравнения')
+    parser.add_argument('--save-baseline', help='Сохранить результаты как базовый замер')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимое ухудшение (доля)')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+
+    if args.worker:
+        worker_main(args)
+        return 0
+
+    scales = [scale.strip() for scale in args.scales.split(',') if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        parser.error(f'Неизвестные масштабы: {", ".join(unknown)}')
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'uploads': args.uploads,
+        },
+        'scales': {},
+    }
+    for scale in scales:
+        print(f'Масштаб {scale}: {SCALES[scale][0]} достопримечательностей, {SCALES[scale][1]} изображений галереи',
+              flush=True)
+        # Каждый масштаб — отдельный процесс: чистый импорт приложения и честный пиковый RSS
+        fd, result_file = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            command = [sys.executable, os.path.abspath(__file__), '--worker', scale, '--result-file', result_file,
+                       '--modes', ','.join(args.modes), '--requests', str(args.requests),
+                       '--concurrency', str(args.concurrency), '--uploads', str(args.uploads),
+                       '--seed', str(args.seed)]
+            subprocess.run(command, check=True)
+            with open(result_file, encoding='utf-8') as f:
+                results['scales'][scale] = json.load(f)
+        finally:
+            os.remove(result_file)
+
+    print_table(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('\nРегрессии относительно базового замера:')
+            for line in regressions:
+                print('  ' + line)
+            if args.fail_on_regression:
+                return 1
+        else:
+            print('\nРегрессий относительно базового замера нет')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
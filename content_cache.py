@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+
+
+logger = logging.getLogger(__name__)
+
+
+def freeze(value):
+    """Превращение разобранного JSON в неизменяемый снимок"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Изменяемая копия снимка (для маршрутов, которые правят данные)"""
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def _remove_quietly(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _write_json_temp(path, data):
+    """JSON во временный файл в папке path (с fsync); возвращает путь временного файла"""
+    folder = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            # Сохраняем права исходного файла (mkstemp создает файл с правами 0600);
+            # os.chmod по пути, а не fchmod: его нет в Windows
+            try:
+                os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+            except FileNotFoundError:
+                os.chmod(tmp_path, 0o644)
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+    return tmp_path
+
+
+def write_json_atomic(path, data):
+    """Атомарная запись JSON: временный файл в той же папке + os.replace"""
+    tmp_path = _write_json_temp(path, data)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+def store_many(changes):
+    """Запись нескольких JsonFileCache одним изменением: все или ничего.
+
+    changes — список пар (cache, data). Сначала все данные пишутся во
+    временные файлы, и только после этого файлы заменяются os.replace.
+    Прежние версии сохраняются жесткими ссылками: если замена одного из
+    файлов не удалась, уже замененные возвращаются к прежнему содержимому.
+    """
+    tmp_paths = []
+    try:
+        for cache, data in changes:
+            tmp_paths.append(_write_json_temp(cache.path, data))
+    except BaseException:
+        _remove_quietly(*tmp_paths)
+        raise
+
+    # Путь -> прежняя версия (None, если файла не было)
+    backups = []
+    try:
+        for (cache, data), tmp_path in zip(changes, tmp_paths):
+            backup_path = None
+            if os.path.exists(cache.path):
+                backup_path = tmp_path + '.bak'
+                os.link(cache.path, backup_path)
+            backups.append((cache.path, backup_path))
+            os.replace(tmp_path, cache.path)
+    except BaseException:
+        for path, backup_path in reversed(backups):
+            try:
+                if backup_path is not None:
+                    os.replace(backup_path, path)
+                else:
+                    os.remove(path)
+            except OSError:
+                logger.exception("Не удалось вернуть прежнюю версию %s", path)
+        _remove_quietly(*tmp_paths)
+        raise
+    _remove_quietly(*(backup_path for _, backup_path in backups if backup_path is not None))
+
+    for cache, data in changes:
+        with cache._lock:
+            cache._stored(data)
+
+
+class JsonFileCache:
+    """Кэш JSON-файла в памяти процесса.
+
+    Файл перечитывается только если изменилась его подпись
+    (mtime_ns, размер, inode), а сама подпись проверяется не чаще,
+    чем раз в check_interval_ms миллисекунд.
+    """
+
+    def __init__(self, path, default_factory, check_interval_ms=1000):
+        self.path = path
+        self.default_factory = default_factory
+        self.check_interval = check_interval_ms / 1000.0
+        self.version = 0
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._signature = None
+        self._checked_at = 0.0
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _read(self, signature):
+        if signature is None:
+            return self.default_factory()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            logger.exception("Ошибка при чтении %s", self.path)
+            return self.default_factory()
+
+    def _is_fresh(self, now):
+        return self._snapshot is not None and now - self._checked_at < self.check_interval
+
+    def get(self):
+        """Неизменяемый снимок содержимого файла"""
+        if self._is_fresh(time.monotonic()):
+            return self._snapshot
+
+        with self._lock:
+            if self._is_fresh(time.monotonic()):
+                return self._snapshot
+
+            # Подпись берем до чтения: если файл поменяется во время чтения,
+            # следующая проверка увидит новую подпись и перечитает его
+            signature = self._stat_signature()
+            if self._snapshot is None or signature != self._signature:
+                self._snapshot = freeze(self._read(signature))
+                self._signature = signature
+                self.version += 1
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def store(self, data):
+        """Атомарная запись данных в файл и немедленное обновление кэша"""
+        with self._lock:
+            write_json_atomic(self.path, data)
+            self._stored(data)
+
+    def _stored(self, data):
+        # Файл уже записан: кэш принимает данные без перечитывания
+        self._snapshot = freeze(data)
+        self._signature = self._stat_signature()
+        self._checked_at = time.monotonic()
+        self.version += 1
+
+    def expire(self):
+        """Следующий get() сразу перепроверит подпись файла (без принудительного чтения)"""
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """Сброс кэша: следующий get() перечитает файл"""
+        with self._lock:
+            self._snapshot = None
+            self._signature = None
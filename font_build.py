@@ -0,0 +1,176 @@
+import os
+import re
+
+try:
+    from fontTools import subset as ft_subset
+except ImportError:  # fontTools (и brotli для WOFF2) нужны только для сборки шрифтов
+    ft_subset = None
+
+
+# Правила @font-face с исходными TTF/OTF (относительно static/)
+FONTS_SOURCE_STYLESHEET = 'css/fonts-source.css'
+
+# Готовые шрифты, таблица стилей и манифест для шаблонов (относительно static/)
+FONTS_BUILD_DIR = 'css/fonts/build'
+FONTS_STYLESHEET = 'css/fonts.css'
+FONTS_MANIFEST = 'css/fonts/build/manifest.json'
+
+# Базовый набор символов: латиница, кириллица, знаки препинания, №, ₽
+BASE_CODEPOINTS = (
+    set(range(0x20, 0x7F)) |
+    set(range(0xA0, 0x100)) |
+    set(range(0x400, 0x460)) |
+    set(range(0x2010, 0x2028)) |
+    set(range(0x2030, 0x203B)) |
+    {0x2116, 0x20BD, 0x20AC, 0x2122}
+)
+
+# Разбиение набора на части для unicode-range: браузер скачает только нужные
+SUBSET_GROUPS = (
+    ('cyrillic', lambda cp: 0x400 <= cp <= 0x52F or cp in (0x2116, 0x20BD)),
+    ('latin', lambda cp: True),
+)
+
+FONT_FACE_RE = re.compile(r'@font-face\s*\{(.*?)\}', re.S)
+DESCRIPTOR_RE = re.compile(r'([a-z-]+)\s*:\s*([^;]+);')
+URL_RE = re.compile(r"url\(\s*['\"]?([^'\")]+)['\"]?\s*\)")
+
+
+class FontBuildError(Exception):
+    """Ошибка сборки шрифтов"""
+
+
+def fonts_available():
+    """Доступна ли сборка шрифтов (установлены ли fontTools и brotli)"""
+    if ft_subset is None:
+        return False
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_font_faces(css_path):
+    """Правила @font-face из таблицы стилей: семейство, начертание, путь к файлу"""
+    with open(css_path, 'r', encoding='utf-8') as f:
+        css = f.read()
+    css_dir = os.path.dirname(css_path)
+
+    faces = []
+    for block in FONT_FACE_RE.findall(css):
+        descriptors = {name.strip(): value.strip() for name, value in DESCRIPTOR_RE.findall(block)}
+        match = URL_RE.search(descriptors.get('src', ''))
+        if not match or 'font-family' not in descriptors:
+            continue
+        faces.append({
+            'family': descriptors['font-family'].strip('\'"'),
+            'weight': descriptors.get('font-weight', '400'),
+            'style': descriptors.get('font-style', 'normal'),
+            'source': os.path.normpath(os.path.join(css_dir, match.group(1)))
+        })
+    return faces
+
+
+def collect_codepoints(texts):
+    """Символы, встречающиеся в текстах (шаблоны, контент), плюс базовый набор"""
+    codepoints = set(BASE_CODEPOINTS)
+    for text in texts:
+        codepoints.update(ord(char) for char in text if ord(char) >= 0x20)
+    return codepoints
+
+
+def format_unicode_range(codepoints):
+    """Сжатие набора символов в значение unicode-range"""
+    ranges = []
+    for cp in sorted(codepoints):
+        if ranges and cp == ranges[-1][1] + 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return ', '.join(f'U+{start:X}' if start == end else f'U+{start:X}-{end:X}' for start, end in ranges)
+
+
+def _subset_font(source, target, codepoints):
+    options = ft_subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']
+    options.name_IDs = ['*']
+    options.notdef_outline = True
+    font = ft_subset.load_font(source, options)
+    try:
+        subsetter = ft_subset.Subsetter(options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(font)
+        # В unicode-range пишем только то, что реально есть в шрифте
+        covered = set(font.getBestCmap() or {})
+        tmp_path = target + '.tmp'
+        ft_subset.save_font(font, tmp_path, options)
+        os.replace(tmp_path, target)
+    finally:
+        font.close()
+    return covered & set(codepoints)
+
+
+def build_fonts(static_folder, faces, codepoints, preload_families=()):
+    """Сборка WOFF2-подмножеств, таблицы стилей @font-face и манифеста.
+
+    Возвращает манифест: {'stylesheet': ..., 'preload': [...], 'files': [...]}
+    """
+    if not fonts_available():
+        raise FontBuildError('Для сборки шрифтов нужны fontTools и brotli (pip install fonttools brotli)')
+
+    build_dir = os.path.join(static_folder, FONTS_BUILD_DIR)
+    os.makedirs(build_dir, exist_ok=True)
+
+    preload_families = {family.strip() for family in preload_families}
+    rules = []
+    files = []
+    preload = []
+    for face in faces:
+        stem = os.path.splitext(os.path.basename(face['source']))[0]
+        remaining = set(codepoints)
+        for group, matches in SUBSET_GROUPS:
+            group_codepoints = {cp for cp in remaining if matches(cp)}
+            remaining -= group_codepoints
+            if not group_codepoints:
+                continue
+
+            filename = f'{stem}.{group}.woff2'
+            covered = _subset_font(face['source'], os.path.join(build_dir, filename), group_codepoints)
+            if not covered:
+                os.remove(os.path.join(build_dir, filename))
+                continue
+
+            static_path = f'{FONTS_BUILD_DIR}/{filename}'
+            files.append(static_path)
+            rules.append({
+                'family': face['family'],
+                'weight': face['weight'],
+                'style': face['style'],
+                'path': static_path,
+                'unicode_range': format_unicode_range(covered)
+            })
+            # Для русскоязычной страницы критична кириллическая часть
+            if face['family'].strip() in preload_families and group == 'cyrillic':
+                preload.append(static_path)
+
+    return {'stylesheet': FONTS_STYLESHEET, 'preload': preload, 'files': files, 'rules': rules}
+
+
+def render_stylesheet(rules, url_for_path):
+    """Текст fonts.css; url_for_path(path) возвращает URL файла относительно css/"""
+    blocks = []
+    for rule in rules:
+        blocks.append(
+            '@font-face {\n'
+            f"    font-family: '{rule['family']}';\n"
+            f"    src: url('{url_for_path(rule['path'])}') format('woff2');\n"
+            f"    font-weight: {rule['weight']};\n"
+            f"    font-style: {rule['style']};\n"
+            '    font-display: swap;\n'
+            f"    unicode-range: {rule['unicode_range']};\n"
+            '}\n'
+        )
+    header = '/* Файл создан командой build-fonts, не редактируйте вручную */\n\n'
+    return header + '\n'.join(blocks)
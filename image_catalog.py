@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+
+ImageEntry = namedtuple('ImageEntry', ['name', 'size', 'created', 'modified', 'ext'])
+
+# source — снимок постоянного индекса, из которого построен список (None, если папка сканировалась)
+_FolderIndex = namedtuple('_FolderIndex', ['mtime_ns', 'checked_at', 'entries', 'source'], defaults=(None,))
+
+
+class ImageCatalog:
+    """Индекс папок с изображениями в памяти процесса.
+
+    Каждая папка сканируется одним os.scandir и хранится как
+    отсортированный по имени кортеж ImageEntry. Повторное сканирование
+    происходит только если изменился mtime самой папки, а mtime
+    проверяется не чаще, чем раз в check_interval_ms миллисекунд.
+    Маршруты загрузки и удаления обновляют индекс на месте.
+
+    Если передан постоянный индекс метаданных (image_index.ImageIndex) и у
+    папки он есть, список строится из него и папка не сканируется.
+    """
+
+    def __init__(self, extensions, check_interval_ms=1000, metadata_index=None):
+        self.extensions = frozenset(extensions)
+        self.check_interval = check_interval_ms / 1000.0
+        self.metadata_index = metadata_index
+        # Растет при любом изменении содержимого любой папки
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._folders = {}
+
+    def _folder_mtime(self, folder):
+        try:
+            return os.stat(folder).st_mtime_ns
+        except OSError:
+            return None
+
+    def _image_ext(self, name):
+        if name.startswith('.') or '.' not in name:
+            return None
+        ext = name.rsplit('.', 1)[1].lower()
+        return ext if ext in self.extensions else None
+
+    def _scan(self, folder):
+        entries = []
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    ext = self._image_ext(entry.name)
+                    if ext is None:
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append(ImageEntry(entry.name, st.st_size, st.st_ctime, st.st_mtime, ext))
+        except (FileNotFoundError, NotADirectoryError):
+            return ()
+        entries.sort(key=lambda item: item.name)
+        return tuple(entries)
+
+    def _from_metadata(self, folder, files):
+        # Снимок индекса неизменяем: пока это тот же объект, список актуален
+        index = self._folders.get(folder)
+        if index is not None and index.source is files:
+            return index.entries
+        entries = tuple(sorted((
+            ImageEntry(name, meta.get('size', 0), meta.get('uploaded'), meta.get('mtime_ns', 0) / 1e9,
+                       self._image_ext(name))
+            for name, meta in files.items() if self._image_ext(name) is not None
+        ), key=lambda item: item.name))
+        with self._lock:
+            if index is None or index.entries != entries:
+                self.generation += 1
+            self._folders[folder] = _FolderIndex(self._folder_mtime(folder), time.monotonic(), entries, files)
+        return entries
+
+    def list(self, folder):
+        """Изображения папки, отсортированные по имени"""
+        if self.metadata_index is not None:
+            files = self.metadata_index.files(folder)
+            if files is not None:
+                return self._from_metadata(folder, files)
+
+        index = self._folders.get(folder)
+        now = time.monotonic()
+        if index is not None and now - index.checked_at < self.check_interval:
+            return index.entries
+
+        with self._lock:
+            index = self._folders.get(folder)
+            mtime_ns = self._folder_mtime(folder)
+            # Список из постоянного индекса сканом не считается: папку сканируем заново
+            if index is not None and index.source is None and index.mtime_ns == mtime_ns:
+                self._folders[folder] = index._replace(checked_at=time.monotonic())
+                return index.entries
+
+            entries = self._scan(folder) if mtime_ns is not None else ()
+            if index is None or index.entries != entries:
+                self.generation += 1
+            self._folders[folder] = _FolderIndex(mtime_ns, time.monotonic(), entries)
+            return entries
+
+    def names(self, folder):
+        """Только имена файлов папки"""
+        return [entry.name for entry in self.list(folder)]
+
+    def add(self, folder, name):
+        """Добавление (или обновление) только что записанного файла"""
+        ext = self._image_ext(name)
+        if ext is None:
+            return
+        st = os.stat(os.path.join(folder, name))
+        new_entry = ImageEntry(name, st.st_size, st.st_ctime, st.st_mtime, ext)
+        with self._lock:
+            index = self._folders.get(folder)
+            if index is None:
+                # Папку еще не индексировали: полный скан при первом обращении
+                return
+            entries = [entry for entry in index.entries if entry.name != name]
+            entries.append(new_entry)
+            entries.sort(key=lambda item: item.name)
+            self._folders[folder] = _FolderIndex(self._folder_mtime(folder), time.monotonic(), tuple(entries))
+            self.generation += 1
+
+    def remove(self, folder, name):
+        """Удаление файла из индекса"""
+        with self._lock:
+            index = self._folders.get(folder)
+            if index is None:
+                return
+            entries = tuple(entry for entry in index.entries if entry.name != name)
+            self._folders[folder] = _FolderIndex(self._folder_mtime(folder), time.monotonic(), entries)
+            self.generation += 1
+
+    def expire(self):
+        """Следующее обращение к каждой папке перепроверит ее mtime"""
+        with self._lock:
+            self._folders = {folder: index._replace(checked_at=0.0) for folder, index in self._folders.items()}
+
+    def forget(self, folder):
+        """Удаление папки из индекса (например, после rmtree)"""
+        with self._lock:
+            if self._folders.pop(folder, None) is not None:
+                self.generation += 1
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from content_cache import JsonFileCache, thaw
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow размеры изображений в индекс не попадают
+    Image = None
+
+
+# Индекс лежит в самой папке изображений; скрытые файлы сайт не показывает
+INDEX_NAME = '.images.json'
+LOCK_NAME = '.images.lock'
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def probe_image(path):
+    """(ширина, высота, формат) по заголовку файла, без декодирования пикселей"""
+    ext = path.rsplit('.', 1)[-1].lower()
+    if Image is None:
+        return None, None, ext
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            return width, height, (image.format or ext).lower()
+    except Exception:
+        return None, None, ext
+
+
+class ImageIndex:
+    """Постоянный индекс метаданных изображений по папкам.
+
+    Для каждой папки в файле .images.json хранится имя файла ->
+    sha256, размер, размеры в пикселях, формат, время загрузки и
+    mtime_ns. Индекс ведут маршруты загрузки и удаления; по хэшу
+    находятся повторные загрузки того же файла. Первая запись в папку
+    без индекса создает неполный индекс из одного файла: files() для
+    него возвращает None (список строится сканированием), пока
+    reconcile() не допишет остальные файлы. После ручных правок файлов
+    индекс также чинит reconcile().
+    """
+
+    def __init__(self, extensions, check_interval_ms=1000):
+        self.extensions = frozenset(extensions)
+        self.check_interval_ms = check_interval_ms
+        # Защищает только словари папок; сами папки блокируются по отдельности
+        self._lock = threading.Lock()
+        self._folder_locks = {}
+        self._held = threading.local()
+        self._caches = {}
+
+    def _cache(self, folder):
+        cache = self._caches.get(folder)
+        if cache is None:
+            cache = self._caches.setdefault(
+                folder, JsonFileCache(os.path.join(folder, INDEX_NAME), dict, self.check_interval_ms))
+        return cache
+
+    @contextmanager
+    def locked(self, folder):
+        """Блокировка индекса папки; повторный вход из того же потока не блокирует"""
+        held = getattr(self._held, 'folders', None)
+        if held is None:
+            held = self._held.folders = set()
+        if folder in held:
+            yield
+            return
+        with self._lock:
+            folder_lock = self._folder_locks.get(folder)
+            if folder_lock is None:
+                folder_lock = self._folder_locks[folder] = threading.Lock()
+        # Индекс папки меняют и другие процессы приложения: flock на файле рядом с ним
+        with folder_lock:
+            held.add(folder)
+            try:
+                if fcntl is None:
+                    yield
+                    return
+                os.makedirs(folder, exist_ok=True)
+                with open(os.path.join(folder, LOCK_NAME), 'a') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+            finally:
+                held.discard(folder)
+
+    def _is_image(self, name):
+        return not name.startswith('.') and '.' in name and name.rsplit('.', 1)[1].lower() in self.extensions
+
+    # Чтение
+
+    def files(self, folder):
+        """Имя файла -> метаданные (неизменяемый снимок) или None, если у папки нет полного индекса"""
+        data = self._cache(folder).get()
+        return None if data.get('partial') else data.get('files')
+
+    def is_partial(self, folder):
+        """Индекс есть, но в нем только загруженные после его создания файлы"""
+        return bool(self._cache(folder).get().get('partial'))
+
+    def get(self, folder, name):
+        files = self.files(folder)
+        return files.get(name) if files is not None else None
+
+    def find_by_hash(self, folder, sha256):
+        """Имя уже загруженного файла с тем же содержимым или None"""
+        # Неполный индекс тоже годится: в нем как раз последние загрузки
+        for name, meta in (self._cache(folder).get().get('files') or {}).items():
+            if meta.get('sha256') == sha256 and os.path.exists(os.path.join(folder, name)):
+                return name
+        return None
+
+    # Изменение
+
+    def _describe(self, folder, name, sha256=None, uploaded=None):
+        path = os.path.join(folder, name)
+        st = os.stat(path)
+        width, height, image_format = probe_image(path)
+        return {
+            'sha256': sha256 or file_sha256(path),
+            'size': st.st_size,
+            'width': width,
+            'height': height,
+            'format': image_format,
+            'uploaded': uploaded if uploaded is not None else st.st_mtime,
+            'mtime_ns': st.st_mtime_ns,
+        }
+
+    def _fresh(self, folder):
+        cache = self._cache(folder)
+        cache.invalidate()
+        return thaw(cache.get())
+
+    def _fresh_files(self, folder):
+        return self._fresh(folder).get('files')
+
+    def add(self, folder, name, sha256=None):
+        """Запись только что загруженного файла"""
+        with self.locked(folder):
+            data = self._fresh(folder)
+            if 'files' not in data:
+                # У папки еще нет индекса: остальные файлы допишет reconcile(), а не эта загрузка
+                data = {'files': {}, 'partial': True}
+            data['files'][name] = self._describe(folder, name, sha256, uploaded=time.time())
+            self._cache(folder).store(data)
+
+    def remove(self, folder, name):
+        with self.locked(folder):
+            data = self._fresh(folder)
+            if name not in data.get('files', {}):
+                return
+            data['files'].pop(name)
+            self._cache(folder).store(data)
+
+    def expire(self):
+        """Следующее чтение перепроверит файлы индексов всех папок"""
+        for cache in list(self._caches.values()):
+            cache.expire()
+
+    def forget(self, folder):
+        """Сброс кэша папки (например, после ее удаления)"""
+        with self._lock:
+            self._caches.pop(folder, None)
+
+    def reconcile(self, folder):
+        """Сверка индекса с файлами папки; возвращает (добавлено, обновлено, удалено)"""
+        with self.locked(folder):
+            return self._reconcile_locked(folder, self._fresh_files(folder) or {})
+
+    def _reconcile_locked(self, folder, files):
+        added = updated = 0
+        present = {}
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if not self._is_image(entry.name) or not entry.is_file():
+                continue
+            st = entry.stat()
+            meta = files.get(entry.name)
+            if meta is not None and meta.get('size') == st.st_size and meta.get('mtime_ns') == st.st_mtime_ns:
+                present[entry.name] = meta
+                continue
+            # Новый или измененный вручную файл: хэш и размеры считаются заново
+            present[entry.name] = self._describe(
+                folder, entry.name, uploaded=meta.get('uploaded') if meta else None)
+            if meta is None:
+                added += 1
+            else:
+                updated += 1
+        removed = len(files.keys() - present.keys())
+        if os.path.isdir(folder):
+            self._cache(folder).store({'files': present})
+        return added, updated, removed
@@ -0,0 +1,238 @@
+import base64
+import io
+import os
+import threading
+
+from content_cache import JsonFileCache, thaw
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен: сайт работает на оригиналах
+    Image = None
+
+
+# Ширины производных изображений и параметры кодирования
+VARIANT_WIDTHS = (480, 960, 1600, 2400)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+# Заглушка (LQIP): крошечная копия, которая встраивается в страницу как data URI
+# и показывается, пока грузится само изображение
+PLACEHOLDER_SIZE = 20
+PLACEHOLDER_QUALITY = 40
+
+# EXIF-ориентации, при которых изображение поворачивается на 90°
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Производные лежат в подпапке рядом с оригиналами, вместе с манифестом
+VARIANTS_DIRNAME = '_variants'
+MANIFEST_NAME = 'manifest.json'
+
+_manifest_lock = threading.Lock()
+_manifest_caches = {}
+
+
+def variants_available():
+    """Доступна ли генерация производных (установлен ли Pillow)"""
+    return Image is not None
+
+
+def get_manifest_path(folder):
+    return os.path.join(folder, VARIANTS_DIRNAME, MANIFEST_NAME)
+
+
+def _get_manifest_cache(folder):
+    path = get_manifest_path(folder)
+    cache = _manifest_caches.get(path)
+    if cache is None:
+        cache = _manifest_caches.setdefault(path, JsonFileCache(path, dict))
+    return cache
+
+
+def get_folder_variants(folder):
+    """Манифест папки: имя оригинала -> описание производных (неизменяемый снимок)"""
+    return _get_manifest_cache(folder).get()
+
+
+def expire_manifests():
+    """Следующее чтение перепроверит манифесты всех папок"""
+    for cache in list(_manifest_caches.values()):
+        cache.expire()
+
+
+def manifest_version(folder):
+    """Версия манифеста папки в этом процессе (растет при каждом изменении)"""
+    cache = _get_manifest_cache(folder)
+    cache.get()
+    return cache.version
+
+
+def _variants_dir(folder):
+    """Папка производных; сама папка изображений заново не создается"""
+    variants_dir = os.path.join(folder, VARIANTS_DIRNAME)
+    # Только mkdir: блок, удаленный посреди обработки, не должен появиться снова
+    try:
+        os.mkdir(variants_dir)
+    except FileExistsError:
+        pass
+    return variants_dir
+
+
+def _update_manifest(folder, filename, entry):
+    with _manifest_lock:
+        cache = _get_manifest_cache(folder)
+        # Перечитываем манифест с диска: его могла обновить другая команда
+        cache.invalidate()
+        manifest = thaw(cache.get())
+        if entry is None:
+            if filename not in manifest:
+                return
+            manifest.pop(filename)
+        else:
+            manifest[filename] = entry
+        _variants_dir(folder)
+        cache.store(manifest)
+
+
+def _variant_name(filename, width, ext):
+    return f"{filename}-{width}w.{ext}"
+
+
+def _target_widths(original_width):
+    widths = [width for width in VARIANT_WIDTHS if width < original_width]
+    # Маленький оригинал все равно получает одну сжатую копию своей ширины
+    return widths or [original_width]
+
+
+def is_up_to_date(folder, filename):
+    """Есть ли в манифесте свежие производные для файла"""
+    entry = get_folder_variants(folder).get(filename)
+    if entry is None:
+        return False
+    try:
+        st = os.stat(os.path.join(folder, filename))
+    except OSError:
+        return False
+    return entry.get('source_mtime_ns') == st.st_mtime_ns and entry.get('source_size') == st.st_size
+
+
+def _make_placeholder(image):
+    small = image.copy()
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    if small.mode != 'RGB':
+        small = small.convert('RGB')
+    buffer = io.BytesIO()
+    small.save(buffer, 'JPEG', quality=PLACEHOLDER_QUALITY, optimize=True)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def has_placeholder(folder, filename):
+    entry = get_folder_variants(folder).get(filename)
+    return entry is not None and 'placeholder' in entry
+
+
+def generate_placeholder(folder, filename):
+    """Заглушка и размеры для файла, у которого уже есть производные (дозаполнение манифеста)"""
+    if Image is None:
+        return None
+
+    with Image.open(os.path.join(folder, filename)) as original:
+        width, height = original.size
+        if original.getexif().get(0x0112) in _ROTATED_ORIENTATIONS:
+            width, height = height, width
+        # JPEG декодируется сразу в уменьшенном виде: полный размер для заглушки не нужен
+        original.draft('RGB', (PLACEHOLDER_SIZE * 8, PLACEHOLDER_SIZE * 8))
+        placeholder = _make_placeholder(ImageOps.exif_transpose(original))
+
+    with _manifest_lock:
+        cache = _get_manifest_cache(folder)
+        cache.invalidate()
+        manifest = thaw(cache.get())
+        entry = manifest.get(filename)
+        if entry is None:
+            return None
+        entry.update(width=width, height=height, placeholder=placeholder)
+        cache.store(manifest)
+    return entry
+
+
+def generate_variants(folder, filename):
+    """Создание производных по ширинам в WebP и JPEG и запись в манифест"""
+    if Image is None:
+        return None
+
+    source_path = os.path.join(folder, filename)
+    st = os.stat(source_path)
+    variants_dir = _variants_dir(folder)
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        width, height = image.size
+
+        variants = []
+        for target_width in _target_widths(width):
+            target_height = max(1, round(height * target_width / width))
+            resized = image if target_width == width else image.resize((target_width, target_height), Image.LANCZOS)
+
+            webp_name = _variant_name(filename, target_width, 'webp')
+            jpeg_name = _variant_name(filename, target_width, 'jpg')
+            _save_atomic(resized, os.path.join(variants_dir, webp_name), 'WEBP', quality=WEBP_QUALITY, method=4)
+            _save_atomic(resized, os.path.join(variants_dir, jpeg_name), 'JPEG',
+                         quality=JPEG_QUALITY, optimize=True, progressive=True)
+            variants.append({'width': target_width, 'height': target_height, 'webp': webp_name, 'jpeg': jpeg_name})
+        placeholder = _make_placeholder(image)
+
+    entry = {
+        'width': width,
+        'height': height,
+        'placeholder': placeholder,
+        'source_size': st.st_size,
+        'source_mtime_ns': st.st_mtime_ns,
+        'variants': variants
+    }
+    _update_manifest(folder, filename, entry)
+    return entry
+
+
+def _save_atomic(image, path, image_format, **params):
+    tmp_path = path + '.tmp'
+    image.save(tmp_path, image_format, **params)
+    os.replace(tmp_path, path)
+
+
+def remove_variants(folder, filename):
+    """Удаление производных файла и его записи из манифеста"""
+    entry = get_folder_variants(folder).get(filename)
+    if entry is None:
+        return
+    for variant in entry.get('variants', ()):
+        for name in (variant.get('webp'), variant.get('jpeg')):
+            if name:
+                try:
+                    os.remove(os.path.join(folder, VARIANTS_DIRNAME, name))
+                except FileNotFoundError:
+                    pass
+    _update_manifest(folder, filename, None)
+
+
+def describe_variants(folder, static_path, filename):
+    """Производные файла с путями относительно static (для шаблонов и API)"""
+    entry = get_folder_variants(folder).get(filename)
+    if entry is None:
+        return []
+    prefix = f"{static_path}/{VARIANTS_DIRNAME}/"
+    return [{
+        'width': variant['width'],
+        'webp': prefix + variant['webp'],
+        'jpeg': prefix + variant['jpeg']
+    } for variant in entry.get('variants', ())]
+
+
+def describe_placeholder(folder, filename):
+    """Размеры оригинала и заглушка из манифеста (изображение при этом не читается)"""
+    entry = get_folder_variants(folder).get(filename)
+    if entry is None:
+        return {'width': None, 'height': None, 'placeholder': None}
+    return {'width': entry.get('width'), 'height': entry.get('height'), 'placeholder': entry.get('placeholder')}
@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+# Состояния задания
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Повторы: задержка перед попыткой N равна RETRY_DELAY * 2 ** (N - 2)
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 5.0
+# Как часто свободный поток заглядывает в таблицу (задания других процессов, отложенные повторы)
+POLL_INTERVAL = 1.0
+# Завершенные задания хранятся столько секунд
+JOB_KEEP_SECONDS = 7 * 24 * 3600
+
+
+class JobError(Exception):
+    """Ошибка задания, которую не имеет смысла повторять"""
+
+
+class JobContext:
+    """То, что получает обработчик: id задания и отчет о ходе работы"""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+
+    def progress(self, done, total=None, message=None):
+        self.queue._update(self.id, progress=done, total=total, message=message)
+
+
+class JobQueue:
+    """Очередь фоновых заданий админ-панели с таблицей в SQLite.
+
+    submit() записывает задание и сразу возвращает его id; задания
+    выполняют max_workers потоков процесса, забирая их из таблицы
+    атомарным UPDATE, поэтому очередь можно делить между несколькими
+    процессами приложения. Упавшее задание повторяется с растущей
+    задержкой до max_attempts раз (кроме JobError). Задания процесса,
+    который завершился посреди работы, возвращаются в очередь.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_after REAL NOT NULL,
+            progress INTEGER,
+            total INTEGER,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            owner INTEGER,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, run_after);
+    '''
+
+    def __init__(self, path, max_workers=1, retry_delay=DEFAULT_RETRY_DELAY):
+        self.path = path
+        self.max_workers = max_workers
+        self.retry_delay = retry_delay
+        self._handlers = {}
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+        self._reset_workers()
+        # Соединения SQLite и потоки не переживают fork
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset_workers(self):
+        self._wakeup = threading.Event()
+        self._workers = []
+        self._workers_lock = threading.Lock()
+
+    def _after_fork(self):
+        self._local = threading.local()
+        self._reset_workers()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        yield conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    # Регистрация и постановка в очередь
+
+    def handler(self, kind):
+        """Декоратор обработчика: func(job, **payload) -> результат (JSON)"""
+        def register(func):
+            self._handlers[kind] = func
+            return func
+        return register
+
+    def submit(self, kind, max_attempts=DEFAULT_MAX_ATTEMPTS, **payload):
+        """Постановка задания в очередь; возвращает id"""
+        if kind not in self._handlers:
+            raise ValueError(f"Неизвестный тип задания: {kind}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute('''INSERT INTO jobs (id, kind, payload, status, max_attempts, run_after, created)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                         (job_id, kind, json.dumps(payload, ensure_ascii=False), QUEUED, max_attempts, now, now))
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    # Чтение
+
+    def get(self, job_id):
+        """Описание задания (для /admin/jobs/<id>) или None"""
+        with self._connection() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._describe(row) if row is not None else None
+
+    def recent(self, limit=50):
+        with self._connection() as conn:
+            rows = conn.execute('SELECT * FROM jobs ORDER BY created DESC LIMIT ?', (limit,)).fetchall()
+        return [self._describe(row) for row in rows]
+
+    def pending(self, kind):
+        """Сколько заданий типа kind ждут выполнения (без отложенных повторов)"""
+        with self._connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM jobs WHERE kind = ? AND status = ? AND run_after <= ?',
+                                (kind, QUEUED, time.time())).fetchone()[0]
+
+    @staticmethod
+    def _describe(row):
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        job.pop('owner')
+        return job
+
+    # Выполнение
+
+    def start(self):
+        """Запуск потоков очереди в этом процессе (повторный вызов ничего не делает)"""
+        if self._workers:
+            return
+        with self._workers_lock:
+            if self._workers:
+                return
+            self._recover()
+            for number in range(self.max_workers):
+                worker = threading.Thread(target=self._run, name=f'job-{number}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception:
+                logger.exception("Ошибка очереди заданий")
+                job = None
+            if job is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _recover(self):
+        """Возврат в очередь заданий, процесс которых завершился посреди работы"""
+        with self._transaction() as conn:
+            rows = conn.execute('SELECT id, owner FROM jobs WHERE status = ?', (RUNNING,)).fetchall()
+            for row in rows:
+                if not _process_alive(row['owner']):
+                    logger.warning("Задание %s прервано, возвращается в очередь", row['id'])
+                    conn.execute('UPDATE jobs SET status = ?, owner = NULL WHERE id = ? AND status = ?',
+                                 (QUEUED, row['id'], RUNNING))
+            conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?',
+                         (DONE, FAILED, time.time() - JOB_KEEP_SECONDS))
+
+    def _claim(self):
+        # Пустая очередь проверяется обычным чтением, без блокировки записи в базе
+        with self._connection() as conn:
+            row = conn.execute('''SELECT * FROM jobs WHERE status = ? AND run_after <= ?
+                                  ORDER BY run_after LIMIT 1''', (QUEUED, time.time())).fetchone()
+        if row is None:
+            return None
+        with self._transaction() as conn:
+            # Задание могли забрать потоки другого процесса
+            claimed = conn.execute('''UPDATE jobs SET status = ?, owner = ?, attempts = attempts + 1, started = ?
+                                      WHERE id = ? AND status = ?''',
+                                   (RUNNING, os.getpid(), time.time(), row['id'], QUEUED)).rowcount
+        return row if claimed else None
+
+    def _execute(self, job):
+        handler = self._handlers.get(job['kind'])
+        attempt = job['attempts'] + 1
+        try:
+            if handler is None:
+                raise JobError(f"Неизвестный тип задания: {job['kind']}")
+            result = handler(JobContext(self, job['id']), **json.loads(job['payload']))
+        except Exception as e:
+            retry = not isinstance(e, JobError) and attempt < job['max_attempts']
+            if retry:
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.warning("Задание %s (%s) упало, повтор через %.0f с: %s", job['id'], job['kind'], delay, e)
+                self._update(job['id'], status=QUEUED, owner=None, error=str(e), run_after=time.time() + delay)
+            else:
+                logger.exception("Задание %s (%s) не выполнено", job['id'], job['kind'])
+                self._update(job['id'], status=FAILED, owner=None, error=str(e), finished=time.time())
+            return
+        self._update(job['id'], status=DONE, owner=None, error=None, finished=time.time(),
+                     result=json.dumps(result, ensure_ascii=False))
+
+    def _update(self, job_id, **fields):
+        # total и message без явных значений не затираются
+        for name in ('total', 'message'):
+            if name in fields and fields[name] is None:
+                fields.pop(name)
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._connection() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    if pid == os.getpid():
+        # Проверка идет до запуска потоков: такие задания остались от прежнего процесса с тем же pid
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,278 @@
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from content_cache import write_json_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows: prefork (serve.py) там все равно недоступен
+    fcntl = None
+
+
+# Границы корзин гистограмм длительности (секунды)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Файлы общего каталога процессов (см. Metrics.share)
+SHARED_WORKER_PATTERN = 'worker-*.json'
+SHARED_RETIRED_NAME = 'retired.json'
+SHARED_LOCK_NAME = '.lock'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Shard:
+    """Значения метрик одного потока: пишет только этот поток"""
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.counters = {}
+        # (name, labels) -> [счетчики корзин..., сумма, количество]
+        self.histograms = {}
+
+    def to_json(self):
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+            'histograms': [[name, list(labels), values] for (name, labels), values in self.histograms.items()],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        shard = cls()
+        for name, labels, value in data.get('counters', ()):
+            shard.counters[(name, tuple(tuple(pair) for pair in labels))] = value
+        for name, labels, values in data.get('histograms', ()):
+            shard.histograms[(name, tuple(tuple(pair) for pair in labels))] = values
+        return shard
+
+    def merge(self, other):
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in other.histograms.items():
+            total = self.histograms.get(key)
+            self.histograms[key] = list(values) if total is None else [a + b for a, b in zip(total, values)]
+
+
+class Metrics:
+    """Счетчики и гистограммы с агрегацией по потокам.
+
+    Каждый поток пишет в свой шард без блокировок; блокировка берется
+    только при появлении нового потока и при сборе значений для
+    /metrics, который суммирует шарды всех потоков. Шарды завершившихся
+    потоков (сервер с потоком на соединение) сливаются в общий итог,
+    поэтому их число не растет вместе с числом соединений.
+
+    Несколько процессов (prefork, serve.py) объединяются через общий
+    каталог share(): каждый процесс периодически и при сборе записывает
+    свои итоги в worker-<pid>.json, а /metrics суммирует файлы всех
+    процессов. Итоги завершившихся процессов retire() переносит в
+    retired.json, поэтому счетчики не сбрасываются при замене процессов.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._base = _Shard()
+        self._descriptions = {}
+        self.shared_dir = None
+        # В дочернем процессе (prefork) счет начинается заново
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        # Итог завершившихся потоков
+        self._base = _Shard()
+
+    def describe(self, name, metric_type, help_text):
+        """Тип (counter/histogram) и описание метрики для вывода"""
+        self._descriptions[name] = (metric_type, help_text)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._prune()
+                self._shards.append(shard)
+        return shard
+
+    def _prune(self):
+        # Вызывается под self._lock: завершившийся поток в свой шард больше не пишет
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                self._base.merge(shard)
+        self._shards = alive
+
+    def shard_count(self):
+        """Число шардов живых потоков (для проверок)"""
+        with self._lock:
+            self._prune()
+            return len(self._shards)
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        counters = self._shard().counters
+        key = self._key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        histograms = self._shard().histograms
+        key = self._key(name, labels)
+        values = histograms.get(key)
+        if values is None:
+            values = histograms[key] = [0] * (len(self.buckets) + 2)
+        # Значения больше последней границы попадают только в +Inf (count)
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            values[i] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def timed(self, name, **labels):
+        """Декоратор: длительность вызова функции в гистограмму name"""
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    def _collect(self):
+        total = self._collect_local()
+        if self.shared_dir is None:
+            return total.counters, total.histograms
+        # Свой файл заменяют значения из памяти, они свежее
+        self.dump(total)
+        own_path = self._worker_path(os.getpid())
+        with self._shared_locked(fcntl.LOCK_SH if fcntl else None):
+            paths = glob.glob(os.path.join(self.shared_dir, SHARED_WORKER_PATTERN))
+            paths.append(os.path.join(self.shared_dir, SHARED_RETIRED_NAME))
+            for path in paths:
+                if path != own_path:
+                    total.merge(self._read_shared(path))
+        return total.counters, total.histograms
+
+    # Общий каталог процессов
+
+    def share(self, directory):
+        """Суммирование метрик процессов через файлы в directory (вызывается до fork)"""
+        os.makedirs(directory, exist_ok=True)
+        self.shared_dir = directory
+
+    def _worker_path(self, pid):
+        return os.path.join(self.shared_dir, f'worker-{pid}.json')
+
+    @contextmanager
+    def _shared_locked(self, mode):
+        if mode is None:
+            yield
+            return
+        with open(os.path.join(self.shared_dir, SHARED_LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_shared(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return _Shard.from_json(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return _Shard()
+
+    def dump(self, total=None):
+        """Запись итогов этого процесса в общий каталог"""
+        if self.shared_dir is None:
+            return
+        total = total if total is not None else self._collect_local()
+        write_json_atomic(self._worker_path(os.getpid()), total.to_json())
+
+    def retire(self, pid):
+        """Перенос итогов завершившегося процесса pid в retired.json (главный процесс)"""
+        worker_path = self._worker_path(pid)
+        if self.shared_dir is None or not os.path.exists(worker_path):
+            return
+        retired_path = os.path.join(self.shared_dir, SHARED_RETIRED_NAME)
+        with self._shared_locked(fcntl.LOCK_EX if fcntl else None):
+            retired = self._read_shared(retired_path)
+            retired.merge(self._read_shared(worker_path))
+            write_json_atomic(retired_path, retired.to_json())
+            os.remove(worker_path)
+
+    def _collect_local(self):
+        total = _Shard()
+        with self._lock:
+            self._prune()
+            total.merge(self._base)
+            shards = list(self._shards)
+        for shard in shards:
+            # Копии: поток может дописывать шард во время сбора
+            snapshot = _Shard()
+            snapshot.counters = dict(shard.counters)
+            snapshot.histograms = {key: list(values) for key, values in list(shard.histograms.items())}
+            total.merge(snapshot)
+        return total
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+    def render_prometheus(self):
+        """Все метрики в текстовом формате Prometheus"""
+        counters, histograms = self._collect()
+        lines = []
+        described = set()
+
+        def header(name, default_type):
+            if name in described:
+                return
+            described.add(name)
+            metric_type, help_text = self._descriptions.get(name, (default_type, ''))
+            if help_text:
+                lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f'{name}{self._format_labels(labels)} {value}')
+
+        for (name, labels), values in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{name}_bucket{self._format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{self._format_labels(labels, [("le", "+Inf")])} {values[-1]}')
+            lines.append(f'{name}_sum{self._format_labels(labels)} {values[-2]}')
+            lines.append(f'{name}_count{self._format_labels(labels)} {values[-1]}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,168 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+
+from flask import g, request, session
+
+from content_cache import write_json_atomic
+
+
+logger = logging.getLogger(__name__)
+
+# Профилирование запроса включается параметром ?_profile=1 или заголовком X-Profile: 1
+PROFILE_QUERY_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+# В ответ добавляется id сохраненного профиля (или busy, если профилировщик занят)
+PROFILE_ID_HEADER = 'X-Profile-ID'
+
+# Сколько последних профилей хранится на диске
+PROFILE_KEEP = int(os.environ.get('DOLINA_PROFILE_KEEP', '20'))
+
+PROFILE_SORT_KEYS = ('cumulative', 'tottime', 'calls')
+PROFILE_ID_RE = re.compile(r'\d{13}-[0-9a-f]{8}')
+
+
+class ProfileStore:
+    """Кольцо последних профилей на диске.
+
+    Профиль — два файла: <id>.prof (формат pstats, открывается snakeviz и
+    подобными инструментами) и <id>.json с описанием запроса. Описание
+    пишется последним, поэтому незаконченный профиль в список не попадает.
+    id начинается с времени в миллисекундах, так что сортировка по имени
+    совпадает с порядком записи; лишние старые профили удаляются.
+    """
+
+    def __init__(self, directory, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id, ext):
+        return os.path.join(self.directory, f'{profile_id}.{ext}')
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names
+                      if name.endswith('.json') and PROFILE_ID_RE.fullmatch(name[:-5]))
+
+    def save(self, profiler, info):
+        """Сохранение профиля; возвращает его id"""
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f'{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}'
+        tmp_path = self._path(profile_id, 'prof.tmp')
+        profiler.dump_stats(tmp_path)
+        os.replace(tmp_path, self._path(profile_id, 'prof'))
+        write_json_atomic(self._path(profile_id, 'json'), dict(info, id=profile_id))
+
+        with self._lock:
+            for old_id in self._ids()[:-self.keep]:
+                for ext in ('json', 'prof'):
+                    try:
+                        os.remove(self._path(old_id, ext))
+                    except FileNotFoundError:
+                        pass
+        return profile_id
+
+    def list(self):
+        """Описания профилей, новые первыми"""
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            info = self.get(profile_id)
+            if info is not None:
+                profiles.append(info)
+        return profiles
+
+    def get(self, profile_id):
+        if not PROFILE_ID_RE.fullmatch(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, 'json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def stats_path(self, profile_id):
+        """Путь к файлу pstats или None"""
+        if not PROFILE_ID_RE.fullmatch(profile_id):
+            return None
+        path = self._path(profile_id, 'prof')
+        return path if os.path.exists(path) else None
+
+    def report(self, profile_id, sort='cumulative', limit=80):
+        """Текстовый отчет: функции по sort и дерево вызовов для верхних из них"""
+        path = self.stats_path(profile_id)
+        if path is None:
+            return None
+        output = io.StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.strip_dirs().sort_stats(sort)
+        stats.print_stats(limit)
+        stats.print_callees(min(limit, 25))
+        return output.getvalue()
+
+
+def setup_profiling(app, store):
+    """Профилирование отдельных запросов администратора по запросу.
+
+    Без параметра и заголовка обработчик ограничивается двумя проверками
+    словарей; анонимный посетитель профилирование включить не может.
+    Одновременно профилируется только один запрос: остальные выполняются
+    как обычно и получают X-Profile-ID: busy.
+    """
+    busy = threading.Lock()
+
+    @app.before_request
+    def start_profiler():
+        if PROFILE_QUERY_PARAM not in request.args and PROFILE_HEADER not in request.headers:
+            return
+        if 'logged_in' not in session:
+            return
+        if not busy.acquire(blocking=False):
+            g.profile_busy = True
+            return
+        profiler = cProfile.Profile()
+        g.profiler = profiler
+        g.profile_started = time.perf_counter()
+        profiler.enable()
+
+    @app.after_request
+    def save_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            if g.pop('profile_busy', False):
+                response.headers[PROFILE_ID_HEADER] = 'busy'
+            return response
+        try:
+            profiler.disable()
+            info = {
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - g.pop('profile_started')) * 1000, 2),
+            }
+            response.headers[PROFILE_ID_HEADER] = store.save(profiler, info)
+        except Exception:
+            logger.exception("Ошибка при сохранении профиля")
+        finally:
+            busy.release()
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # Запрос завершился без after_request: профилировщик не должен остаться включенным
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            busy.release()
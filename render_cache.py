@@ -0,0 +1,74 @@
+import hashlib
+import threading
+from collections import namedtuple
+from functools import wraps
+
+
+RenderedPage = namedtuple('RenderedPage', ['key', 'body', 'etag', 'links'])
+
+
+class RenderCache:
+    """Кэш готовых HTML-страниц, привязанный к поколению контента.
+
+    Запись хранится вместе с ключом, под которым она была отрисована.
+    Ключ строится вызывающим кодом из поколения (generation) и версий
+    исходных данных; любое несовпадение означает повторную отрисовку.
+    succeeded(result) решает, изменил ли маршрут с декоратором
+    invalidates что-нибудь (по умолчанию — любой результат без исключения).
+    """
+
+    def __init__(self, succeeded=None):
+        self.generation = 0
+        self.succeeded = succeeded or (lambda result: True)
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._listeners = []
+
+    def on_bump(self, callback):
+        """callback() вызывается после каждой смены поколения (например, для статического экспорта)"""
+        self._listeners.append(callback)
+
+    def bump(self, notify=True):
+        """Новое поколение контента: все готовые страницы устаревают.
+
+        notify=False — сброс из-за изменения, о котором уже оповестил
+        другой процесс: подписчики в этом случае не вызываются.
+        """
+        with self._lock:
+            self.generation += 1
+            self._pages.clear()
+        if notify:
+            for callback in self._listeners:
+                callback()
+
+    def get(self, name, key):
+        page = self._pages.get(name)
+        if page is not None and page.key == key:
+            return page
+        return None
+
+    def put(self, name, key, body, links=None):
+        """Сохранение отрисованной страницы; key[0] — поколение на момент отрисовки.
+
+        links — значение заголовка Link с предзагрузкой ресурсов страницы.
+        """
+        page = RenderedPage(key, body, hashlib.sha256(body).hexdigest()[:32], links)
+        with self._lock:
+            # Пока страница рисовалась, поколение могло смениться
+            if key[0] == self.generation:
+                self._pages[name] = page
+        return page
+
+    def invalidates(self, f):
+        """Декоратор для маршрутов, изменяющих контент публичных страниц.
+
+        Поколение сменяется только после успешного ответа: отклоненная
+        правка не должна сбрасывать кэши и перезапускать процессы.
+        """
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            result = f(*args, **kwargs)
+            if self.succeeded(result):
+                self.bump()
+            return result
+        return decorated_function
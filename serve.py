@@ -0,0 +1,291 @@
+"""Запуск сайта в нескольких процессах (prefork) без внешних сервисов.
+
+Главный процесс открывает сокет, импортирует приложение и прогревает
+кэши (create_app), после чего создает рабочие процессы через fork:
+они получают готовый снимок контента и скомпилированные шаблоны через
+copy-on-write. Каждый рабочий процесс обслуживает общий сокет своим
+многопоточным WSGI-сервером.
+
+Изменения контента координируются счетчиком поколений в общей памяти:
+процесс, в котором администратор изменил контент, увеличивает счетчик,
+остальные сбрасывают свои кэши на следующем запросе. Главный процесс
+заново прогревает снимок и по одному плавно заменяет рабочие процессы
+(новый запускается до остановки старого, старый дообрабатывает запросы).
+
+    python serve.py --workers 4 --port 5011
+
+Метрики /metrics суммируются по всем рабочим процессам: запрос может
+попасть в любой из них, поэтому процессы раз в METRICS_DUMP_INTERVAL
+секунд (и при остановке) пишут свои итоги во временный общий каталог,
+а обработчик /metrics складывает файлы всех процессов. Итоги замененных
+процессов главный процесс переносит в общий итог, так что счетчики не
+сбрасываются при замене; значения других процессов отстают не больше
+чем на METRICS_DUMP_INTERVAL.
+
+SIGHUP — плавная замена всех рабочих процессов, SIGTERM/SIGINT — остановка.
+"""
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger('serve')
+
+# Сколько рабочий процесс ждет завершения начатых запросов при остановке
+GRACEFUL_TIMEOUT = 30
+# Как часто главный процесс проверяет рабочие процессы и счетчик поколений
+MASTER_POLL_INTERVAL = 0.2
+# Как часто рабочий процесс записывает свои метрики в общий каталог
+METRICS_DUMP_INTERVAL = 2.0
+
+
+class SharedGeneration:
+    """Счетчик поколений контента в общей памяти процессов.
+
+    publish() вызывается при смене поколения кэша в процессе (изменение
+    из админ-панели) и увеличивает общий счетчик; sync() в начале запроса
+    сравнивает счетчик с последним увиденным и, если другой процесс успел
+    изменить контент, вызывает on_change() — сброс кэшей этого процесса.
+    Чтение счетчика идет без блокировки: это одно машинное слово.
+    """
+
+    def __init__(self):
+        self._value = multiprocessing.RawValue('Q', 0)
+        self._lock = multiprocessing.Lock()
+        self.seen = 0
+
+    @property
+    def value(self):
+        return self._value.value
+
+    def publish(self):
+        with self._lock:
+            self._value.value += 1
+            self.seen = self._value.value
+
+    def sync(self, on_change):
+        current = self._value.value
+        if current == self.seen:
+            return False
+        self.seen = current
+        on_change()
+        return True
+
+
+def run_worker(app_module, sock, args, generation):
+    """Рабочий процесс: WSGI-сервер на общем сокете до сигнала остановки"""
+    from werkzeug.serving import make_server
+
+    app = app_module.app
+    state = {'inflight': 0, 'handled': 0}
+    state_lock = threading.Lock()
+    stopping = threading.Event()
+
+    def application(environ, start_response):
+        generation.sync(app_module.expire_content_caches)
+        with state_lock:
+            state['handled'] += 1
+            handled = state['handled']
+        if args.max_requests and handled >= args.max_requests:
+            stop()
+        return app(environ, start_response)
+
+    server = make_server(args.host, args.port, application, threaded=True, fd=sock.fileno())
+
+    # Начатые запросы считаются по соединениям: werkzeug не всегда вызывает
+    # close() у ответа, если клиент оборвал соединение
+    process_request = server.process_request
+    process_request_thread = server.process_request_thread
+
+    def counted_process_request(request, client_address):
+        with state_lock:
+            state['inflight'] += 1
+        try:
+            process_request(request, client_address)
+        except BaseException:
+            with state_lock:
+                state['inflight'] -= 1
+            raise
+
+    def counted_process_request_thread(request, client_address):
+        try:
+            process_request_thread(request, client_address)
+        finally:
+            with state_lock:
+                state['inflight'] -= 1
+
+    server.process_request = counted_process_request
+    server.process_request_thread = counted_process_request_thread
+
+    def stop(*_):
+        if not stopping.is_set():
+            stopping.set()
+            # shutdown() ждет выхода из serve_forever, поэтому вызывается из отдельного потока
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    def dump_metrics():
+        while not stopping.wait(METRICS_DUMP_INTERVAL):
+            try:
+                app_module.metrics.dump()
+            except Exception:
+                logger.exception("Ошибка при записи метрик процесса")
+
+    threading.Thread(target=dump_metrics, name='metrics-dump', daemon=True).start()
+
+    server.serve_forever()
+    deadline = time.monotonic() + GRACEFUL_TIMEOUT
+    while state['inflight'] > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    server.server_close()
+    app_module.metrics.dump()
+    app_module.log_pipeline.stop()
+
+
+def spawn_worker(app_module, sock, args, generation):
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        run_worker(app_module, sock, args, generation)
+    except BaseException:
+        logger.exception("Ошибка рабочего процесса")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запуск сайта в нескольких процессах')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5011)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Число рабочих процессов')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='Плавно заменять рабочий процесс после N запросов (0 — не заменять)')
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--access-log', action='store_true', help='Журнал каждого запроса (werkzeug)')
+    args = parser.parse_args()
+
+    sock = socket.create_server((args.host, args.port), backlog=args.backlog)
+    sock.set_inheritable(True)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    generation = SharedGeneration()
+    app_module.render_cache.on_bump(generation.publish)
+    metrics_dir = tempfile.mkdtemp(prefix='dolina-metrics-')
+    app_module.metrics.share(metrics_dir)
+
+    started = time.perf_counter()
+    app_module.create_app()
+    # Объекты снимка не трогает сборщик мусора, поэтому их страницы памяти остаются общими
+    gc.freeze()
+    logger.info("Контент прогрет за %.2f с, запуск %d рабочих процессов на %s:%d",
+                time.perf_counter() - started, args.workers, args.host, args.port)
+
+    # pid -> поколение контента, с которым процесс был запущен
+    workers = {}
+    retiring = set()
+    signals = {'stop': False, 'recycle': False}
+
+    def on_stop(*_):
+        signals['stop'] = True
+
+    def on_hup(*_):
+        signals['recycle'] = True
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, on_hup)
+
+    content_generation = generation.value
+    while not signals['stop']:
+        # Завершившиеся процессы
+        while workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            workers.pop(pid, None)
+            try:
+                app_module.metrics.retire(pid)
+            except Exception:
+                logger.exception("Ошибка при переносе метрик процесса %d", pid)
+            code = os.waitstatus_to_exitcode(status)
+            if pid not in retiring and code != 0:
+                logger.warning("Рабочий процесс %d завершился с кодом %s", pid, code)
+            retiring.discard(pid)
+
+        # Контент изменился: прогреваем снимок заново, рабочие процессы заменяются по одному
+        if generation.value != content_generation or signals['recycle']:
+            signals['recycle'] = False
+            generation.sync(app_module.expire_content_caches)
+            gc.unfreeze()
+            app_module.create_app()
+            gc.freeze()
+            content_generation = generation.seen
+            for pid in workers:
+                workers[pid] = None
+
+        active = [pid for pid in workers if pid not in retiring]
+        while len(active) < args.workers:
+            pid = spawn_worker(app_module, sock, args, generation)
+            workers[pid] = content_generation
+            active.append(pid)
+
+        outdated = [pid for pid in active if workers[pid] != content_generation]
+        if outdated and not retiring:
+            # Сначала новый процесс, потом остановка старого: число обслуживающих не падает
+            pid = spawn_worker(app_module, sock, args, generation)
+            workers[pid] = content_generation
+            os.kill(outdated[0], signal.SIGTERM)
+            retiring.add(outdated[0])
+
+        time.sleep(MASTER_POLL_INTERVAL)
+
+    logger.info("Остановка рабочих процессов")
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + GRACEFUL_TIMEOUT
+    while workers and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            workers.pop(pid, None)
+        else:
+            time.sleep(0.05)
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    sock.close()
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    app_module.log_pipeline.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -81,9 +81,12 @@ const Utils = {
             entries.forEach(entry => {
                 if (entry.isIntersecting) {
                     const img = entry.target;
-                    const bg = img.getAttribute('data-bg');
+                    const srcset = img.getAttribute(Utils.supportsWebp() ? 'data-bg-srcset' : 'data-bg-srcset-jpeg');
+                    const bg = Utils.pickFromSrcset(srcset, img.clientWidth || window.innerWidth) || img.getAttribute('data-bg');
                     if (bg) {
-                        img.style.backgroundImage = `url(${bg})`;
+                        // Заглушка остается нижним слоем, пока грузится изображение
+                        const placeholder = img.getAttribute('data-placeholder');
+                        img.style.backgroundImage = placeholder ? `url(${bg}), url(${placeholder})` : `url(${bg})`;
                         img.removeAttribute('data-bg');
                     }
                     observer.unobserve(img);
@@ -97,6 +100,30 @@ const Utils = {
         lazyImages.forEach(img => imageObserver.observe(img));
     },
 
+    // Поддержка WebP браузером (проверяется один раз)
+    supportsWebp() {
+        if (this._supportsWebp === undefined) {
+            const canvas = document.createElement('canvas');
+            canvas.width = canvas.height = 1;
+            this._supportsWebp = canvas.toDataURL('image/webp').indexOf('data:image/webp') === 0;
+        }
+        return this._supportsWebp;
+    },
+
+    // Выбор копии из srcset ("url 480w, url 960w") под ширину элемента и плотность экрана
+    pickFromSrcset(srcset, cssWidth) {
+        if (!srcset) return null;
+        const candidates = srcset.split(',')
+            .map(item => item.trim().split(/\s+/))
+            .map(([url, width]) => ({ url, width: parseInt(width, 10) }))
+            .filter(item => item.url && item.width)
+            .sort((a, b) => a.width - b.width);
+        if (!candidates.length) return null;
+        const target = cssWidth * (window.devicePixelRatio || 1);
+        const match = candidates.find(item => item.width >= target);
+        return (match || candidates[candidates.length - 1]).url;
+    },
+
     // Получить случайный эмодзи
     getRandomEmoji() {
         return EMOJIS[Math.floor(Math.random() * EMOJIS.length)];
@@ -934,9 +961,19 @@ const GalleryManager = {
         });
     },
 
+    // Размер страницы галереи: следующие страницы подгружаются при прокрутке
+    pageSize: 12,
+
     loadGalleryData() {
         if (!this.galleryGrid) return;
 
+        this.nextCursor = null;
+        this.loadingPage = false;
+        if (this.pageObserver) {
+            this.pageObserver.disconnect();
+            this.pageObserver = null;
+        }
+
         // Показываем индикатор загрузки
         this.galleryGrid.innerHTML = `
             <div style="text-align: center; padding: 40px; color: #718096; grid-column: 1 / -1;">
@@ -945,12 +982,12 @@ const GalleryManager = {
             </div>
         `;
         
-        // Загружаем данные галереи с сервера
-        fetch('/gallery-data')
-            .then(response => response.json())
+        // Загружаем первую страницу галереи с сервера
+        this.fetchGalleryPage(null)
             .then(data => {
                 if (data.success && data.images) {
                     this.renderGallery(data.images);
+                    this.setNextCursor(data.next_cursor);
                 } else {
                     this.showError();
                 }
@@ -961,11 +998,67 @@ const GalleryManager = {
             });
     },
 
+    fetchGalleryPage(cursor) {
+        const params = new URLSearchParams({ limit: this.pageSize });
+        if (cursor) params.set('cursor', cursor);
+        return fetch(`/gallery-data?${params}`).then(response => response.json());
+    },
+
+    // Подгрузка следующей страницы, когда конец сетки появляется на экране
+    setNextCursor(cursor) {
+        this.nextCursor = cursor || null;
+        if (!this.nextCursor) {
+            if (this.pageObserver) this.pageObserver.disconnect();
+            if (this.pageSentinel) this.pageSentinel.remove();
+            return;
+        }
+
+        if (!this.pageSentinel) {
+            this.pageSentinel = document.createElement('div');
+            this.pageSentinel.className = 'gallery-sentinel';
+            this.pageSentinel.style.cssText = 'grid-column: 1 / -1; height: 1px;';
+        }
+        this.galleryGrid.appendChild(this.pageSentinel);
+
+        if (!('IntersectionObserver' in window)) {
+            // Старые браузеры: загружаем оставшиеся страницы сразу
+            this.loadNextPage();
+            return;
+        }
+        if (!this.pageObserver) {
+            this.pageObserver = new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) this.loadNextPage();
+            }, { rootMargin: '400px 0px' });
+        }
+        this.pageObserver.observe(this.pageSentinel);
+    },
+
+    loadNextPage() {
+        if (!this.nextCursor || this.loadingPage) return;
+        this.loadingPage = true;
+
+        this.fetchGalleryPage(this.nextCursor)
+            .then(data => {
+                if (!data.success || !data.images) throw new Error(data.message || 'gallery page');
+                this.appendGalleryItems(data.images);
+                this.setNextCursor(data.next_cursor);
+            })
+            .catch(error => {
+                // Остальные страницы не критичны: уже загруженное остается на месте
+                console.error('Error loading gallery page:', error);
+                this.setNextCursor(null);
+            })
+            .finally(() => {
+                this.loadingPage = false;
+            });
+    },
+
     renderGallery(images) {
         if (!this.galleryGrid) return;
 
         // Очищаем контейнер
         this.galleryGrid.innerHTML = '';
+        STATE.galleryData = [];
         
         if (!images || images.length === 0) {
             this.galleryGrid.innerHTML = `
@@ -975,33 +1068,65 @@ const GalleryManager = {
                     <p style="font-size: 14px; margin-top: 10px;">Изображения скоро появятся</p>
                 </div>
             `;
-            STATE.galleryData = [];
             return;
         }
-        
+
+        this.appendGalleryItems(images);
+    },
+
+    // Добавление элементов в конец сетки; индексы продолжают уже загруженные
+    appendGalleryItems(images) {
+        const offset = STATE.galleryData.length;
+        const fragment = document.createDocumentFragment();
+
         // Создаем элементы галереи
-        images.forEach((image, index) => {
+        images.forEach((image, i) => {
+            const index = offset + i;
             const galleryItem = document.createElement('div');
             galleryItem.className = 'gallery-item';
             galleryItem.setAttribute('data-index', index);
             
-            galleryItem.innerHTML = `
-                <img class="gallery-img" src="/static/${image.path}" alt="${image.alt || 'Фотография парка'}" 
-                     loading="lazy" style="width: 100%; height: 250px; object-fit: cover; border-radius: 8px;">
+            const variants = image.variants || [];
+            const srcset = format => variants.map(v => `/static/${v[format]} ${v.width}w`).join(', ');
+            const sizes = '(max-width: 600px) 100vw, (max-width: 1024px) 50vw, 33vw';
+            // Размеры оригинала и размытая заглушка фоном, пока грузится изображение
+            const dimensions = image.width && image.height ? `width="${image.width}" height="${image.height}"` : '';
+            const placeholder = image.placeholder ? ` background: url(${image.placeholder}) center / cover;` : '';
+            
+            galleryItem.innerHTML = variants.length ? `
+                <picture>
+                    <source type="image/webp" srcset="${srcset('webp')}" sizes="${sizes}">
+                    <img class="gallery-img" src="/static/${variants[0].jpeg}" srcset="${srcset('jpeg')}" sizes="${sizes}"
+                         alt="${image.alt || 'Фотография парка'}" ${dimensions}
+                         loading="lazy" style="width: 100%; height: 250px; object-fit: cover; border-radius: 8px;${placeholder}">
+                </picture>
+            ` : `
+                <img class="gallery-img" src="/static/${image.path}" alt="${image.alt || 'Фотография парка'}" ${dimensions}
+                     loading="lazy" style="width: 100%; height: 250px; object-fit: cover; border-radius: 8px;${placeholder}">
             `;
             
-            this.galleryGrid.appendChild(galleryItem);
+            fragment.appendChild(galleryItem);
             
             // Добавляем обработчик клика
             galleryItem.addEventListener('click', () => this.openMediaPopup(index));
         });
 
+        if (this.pageSentinel && this.pageSentinel.parentNode === this.galleryGrid) {
+            this.galleryGrid.insertBefore(fragment, this.pageSentinel);
+        } else {
+            this.galleryGrid.appendChild(fragment);
+        }
+
         // Сохраняем данные в STATE
-        STATE.galleryData = images.map(img => ({
+        // В попапе показываем копию под ширину экрана, если она есть
+        const popupWidth = window.innerWidth;
+        STATE.galleryData.push(...images.map(img => ({
             type: 'image',
-            src: `/static/${img.path}`,
+            src: `/static/${Utils.pickFromSrcset(
+                (img.variants || []).map(v => `${Utils.supportsWebp() ? v.webp : v.jpeg} ${v.width}w`).join(', '),
+                popupWidth) || img.path}`,
             alt: img.alt || 'Фотография парка'
-        }));
+        })));
     },
 
     showError() {
@@ -0,0 +1,218 @@
+import gzip
+import hashlib
+import logging
+import os
+import stat
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# Сколько байт читать за раз при подсчете хэша
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Длина отпечатка в URL (символов hex)
+FINGERPRINT_LENGTH = 12
+
+
+class AssetFingerprints:
+    """Отпечатки содержимого статических файлов для URL вида ?v=<hash>.
+
+    Хэш считается один раз и пересчитывается, только если у файла
+    поменялись mtime или размер; stat выполняется не чаще, чем раз в
+    check_interval_ms миллисекунд для каждого файла.
+    """
+
+    def __init__(self, static_folder, check_interval_ms=1000):
+        self.static_folder = static_folder
+        self.check_interval = check_interval_ms / 1000.0
+        self._lock = threading.Lock()
+        # filename -> (signature, fingerprint, checked_at)
+        self._entries = {}
+
+    def _resolve(self, filename):
+        path = os.path.normpath(os.path.join(self.static_folder, filename))
+        if not path.startswith(os.path.join(self.static_folder, '')):
+            return None
+        return path
+
+    @staticmethod
+    def _hash_file(path):
+        digest = hashlib.md5(usedforsecurity=False)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:FINGERPRINT_LENGTH]
+
+    def get(self, filename):
+        """Отпечаток файла или None, если файла нет"""
+        entry = self._entries.get(filename)
+        now = time.monotonic()
+        if entry is not None and now - entry[2] < self.check_interval:
+            return entry[1]
+
+        path = self._resolve(filename)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._entries.pop(filename, None)
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+
+        signature = (st.st_mtime_ns, st.st_size)
+        if entry is not None and entry[0] == signature:
+            fingerprint = entry[1]
+        else:
+            fingerprint = self._hash_file(path)
+        with self._lock:
+            self._entries[filename] = (signature, fingerprint, now)
+        return fingerprint
+
+
+# Текстовые файлы, для которых заранее готовятся сжатые копии
+COMPRESSIBLE_EXTENSIONS = frozenset({'.css', '.js', '.svg', '.json', '.txt', '.xml', '.map', '.ttf', '.otf'})
+
+try:
+    import brotli
+except ImportError:  # Без brotli готовятся только .gz
+    brotli = None
+
+
+def _gzip_bytes(data):
+    # mtime=0: одинаковый источник дает одинаковый .gz
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli_bytes(data):
+    return brotli.compress(data, quality=11)
+
+
+def available_encodings():
+    """Поддерживаемые кодировки в порядке предпочтения: (имя, суффикс, функция)"""
+    encodings = []
+    if brotli is not None:
+        encodings.append(('br', '.br', _brotli_bytes))
+    encodings.append(('gzip', '.gz', _gzip_bytes))
+    return encodings
+
+
+def is_compressible(filename):
+    return os.path.splitext(filename)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+class PrecompressedAssets:
+    """Сжатые копии (.br/.gz) текстовой статики рядом с исходными файлами.
+
+    Копия считается актуальной, если ее mtime совпадает с mtime исходника
+    (при записи mtime копируется). Устаревшая копия не отдается: вместо
+    нее отдается исходник, а копия (как и отсутствующая) создается в
+    фоновом потоке, поэтому сжатие не выполняется в обработчике запроса.
+    Все копии разом обновляет compress_all() (create_app, экспорт,
+    команда compress-static).
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._lock = threading.Lock()
+        self._pending = set()
+        # Файлы, которые сжатие не уменьшает: путь -> mtime_ns исходника
+        self._incompressible = {}
+
+    def compress(self, path, force=False):
+        """Создание сжатых копий файла; возвращает список записанных путей"""
+        st = os.stat(path)
+        if not force and self._incompressible.get(path) == st.st_mtime_ns:
+            return []
+        written = []
+        data = None
+        for _, suffix, compress in available_encodings():
+            target = path + suffix
+            if not force and self._is_fresh(target, st):
+                continue
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                # Сжатие не помогает: копию не держим и не пытаемся создать снова
+                self._remove(target)
+                self._incompressible[path] = st.st_mtime_ns
+                continue
+            tmp_path = target + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(tmp_path, target)
+            written.append(target)
+        return written
+
+    def compress_all(self, force=False):
+        """Сжатие всех текстовых файлов статики: (записано копий, просмотрено файлов)"""
+        written = checked = 0
+        for root, _, files in os.walk(self.static_folder):
+            for name in files:
+                if is_compressible(name):
+                    checked += 1
+                    written += len(self.compress(os.path.join(root, name), force=force))
+        return written, checked
+
+    @staticmethod
+    def _is_fresh(target, source_stat):
+        try:
+            return os.stat(target).st_mtime_ns == source_stat.st_mtime_ns
+        except OSError:
+            return False
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _schedule(self, path):
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+
+        def run():
+            try:
+                self.compress(path)
+            except Exception:
+                logger.exception("Ошибка при сжатии %s", path)
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+
+        threading.Thread(target=run, name='precompress', daemon=True).start()
+
+    def find(self, path, accept_encodings):
+        """Лучшая актуальная сжатая копия для Accept-Encoding: (путь, кодировка) или None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        stale = False
+        for encoding, suffix, _ in available_encodings():
+            if not accept_encodings[encoding]:
+                continue
+            try:
+                copy_mtime = os.stat(path + suffix).st_mtime_ns
+            except OSError:
+                # Копии нет (новый файл): создаем, если сжатие вообще помогает
+                stale = stale or self._incompressible.get(path) != st.st_mtime_ns
+                continue
+            if copy_mtime == st.st_mtime_ns:
+                return path + suffix, encoding
+            stale = True
+
+        if stale:
+            self._schedule(path)
+        return None
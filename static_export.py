@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from content_cache import write_json_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# Служебные файлы в папке экспорта
+EXPORT_MANIFEST = '.export-manifest.json'
+EXPORT_LOCK = '.export.lock'
+
+
+def _replace_bytes(path, data):
+    """Атомарная запись байтов: временный файл в той же папке + os.replace"""
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.chmod(tmp_path, 0o644)
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _replace_file(source, target):
+    """Атомарная подмена target файлом source: жесткая ссылка, если возможно, иначе копия"""
+    tmp_path = os.path.join(os.path.dirname(target), f'.{os.path.basename(target)}.{os.getpid()}.tmp')
+    try:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class StaticExport:
+    """Статическая копия публичных страниц для раздачи обычным веб-сервером.
+
+    render_pages() возвращает словарь «путь в папке экспорта -> байты»
+    (index.html, JSON галереи). Страница перезаписывается, только если ее
+    содержимое изменилось; страницы, которых больше нет, удаляются. Хэши
+    записанных страниц хранятся в манифесте экспорта. Папка статики
+    зеркалируется в <target>/static: файлы связываются жесткими ссылками
+    (копируются, если папки на разных дисках), а папки, время изменения
+    которых не поменялось с прошлого экспорта, не перечитываются.
+    Каждый файл подменяется через os.replace, поэтому веб-сервер никогда
+    не видит недописанных файлов. Если передан precompressed
+    (static_assets.PrecompressedAssets), перед зеркалированием обновляются
+    сжатые копии: веб-сервер отдает .br/.gz, не сверяя их с исходником.
+    """
+
+    def __init__(self, target_dir, static_folder, render_pages, precompressed=None):
+        self.target_dir = target_dir
+        self.static_folder = static_folder
+        self.render_pages = render_pages
+        self.precompressed = precompressed
+        self._lock = threading.Lock()
+        # Папка статики -> время изменения на момент последней синхронизации
+        self._synced_dirs = {}
+        self._reset_worker()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @contextmanager
+    def _locked(self):
+        # Экспортировать могут несколько процессов приложения: flock на файле в папке экспорта
+        with self._lock:
+            os.makedirs(self.target_dir, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.target_dir, EXPORT_LOCK), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def export(self):
+        """Экспорт с обновлением только изменившихся файлов; возвращает статистику"""
+        with self._locked():
+            stats = {'pages_written': 0, 'pages_removed': 0, 'files_updated': 0, 'files_removed': 0}
+            self._export_pages(stats)
+            if self.precompressed is not None:
+                self.precompressed.compress_all()
+            self._sync_dir(self.static_folder, os.path.join(self.target_dir, 'static'), stats)
+            return stats
+
+    def _export_pages(self, stats):
+        manifest_path = os.path.join(self.target_dir, EXPORT_MANIFEST)
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                previous = json.load(f).get('pages', {})
+        except (FileNotFoundError, ValueError):
+            previous = {}
+
+        pages = {}
+        for name, body in self.render_pages().items():
+            digest = hashlib.sha256(body).hexdigest()
+            pages[name] = digest
+            path = os.path.join(self.target_dir, name)
+            if previous.get(name) != digest or not os.path.exists(path):
+                _replace_bytes(path, body)
+                stats['pages_written'] += 1
+
+        for name in previous.keys() - pages.keys():
+            _remove(os.path.join(self.target_dir, name))
+            stats['pages_removed'] += 1
+
+        write_json_atomic(manifest_path, {'pages': pages})
+
+    def _sync_dir(self, source, target, stats):
+        try:
+            source_mtime = os.stat(source).st_mtime_ns
+        except FileNotFoundError:
+            return
+        # Содержимое папки не менялось: проверяем только вложенные папки
+        unchanged = self._synced_dirs.get(source) == source_mtime and os.path.isdir(target)
+        os.makedirs(target, exist_ok=True)
+
+        names = set()
+        with os.scandir(source) as entries:
+            for entry in entries:
+                # Временные и служебные файлы (.name.tmp и т.п.) не публикуются
+                if entry.name.startswith('.'):
+                    continue
+                names.add(entry.name)
+                target_path = os.path.join(target, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    self._sync_dir(entry.path, target_path, stats)
+                elif not unchanged and entry.is_file():
+                    if self._needs_update(entry, target_path):
+                        _replace_file(entry.path, target_path)
+                        stats['files_updated'] += 1
+
+        if not unchanged:
+            with os.scandir(target) as entries:
+                for entry in entries:
+                    if entry.name not in names and not entry.name.startswith('.'):
+                        _remove(entry.path)
+                        stats['files_removed'] += 1
+            self._synced_dirs[source] = source_mtime
+
+    @staticmethod
+    def _needs_update(entry, target_path):
+        try:
+            target = os.stat(target_path)
+        except FileNotFoundError:
+            return True
+        source = entry.stat()
+        if (source.st_dev, source.st_ino) == (target.st_dev, target.st_ino):
+            return False
+        return source.st_size != target.st_size or source.st_mtime_ns != target.st_mtime_ns
+
+    # Фоновое обновление после изменений в админ-панели
+
+    def _reset_worker(self):
+        self._pending = threading.Event()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _after_fork(self):
+        # Поток экспорта не переживает fork: в дочернем процессе он запустится заново
+        self._lock = threading.Lock()
+        self._reset_worker()
+
+    def schedule(self):
+        """Запрос на обновление экспорта; несколько запросов подряд объединяются в один"""
+        self._pending.set()
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='static-export', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            try:
+                stats = self.export()
+                logger.info("Статический экспорт обновлен: %s", stats)
+            except Exception:
+                logger.exception("Ошибка статического экспорта")
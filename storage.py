@@ -0,0 +1,452 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from content_cache import JsonFileCache, freeze, store_many, thaw
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+
+# Поля достопримечательности, которые хранятся отдельными колонками в SQLite
+ATTRACTION_COLUMNS = ('id', 'order')
+
+
+class StorageError(Exception):
+    """Ошибка хранилища, текст которой можно показать администратору"""
+
+
+def _strip_images(attraction):
+    # Изображения хранятся в файловой системе, а не в данных
+    attraction = dict(attraction)
+    attraction.pop('images', None)
+    return attraction
+
+
+def _next_attraction_id(last_id, attractions):
+    # Счетчик не дает повторно выдать id удаленной записи, а максимум
+    # защищает от совпадения, если файл данных правили вручную
+    return max(last_id, max((attraction.get('id', 0) for attraction in attractions), default=0)) + 1
+
+
+class JsonStorage:
+    """Хранение контента в page_data.json и attractions_data.json (по умолчанию).
+
+    Чтение идет из JsonFileCache. Каждое изменение выполняется под
+    блокировкой (поток + flock на файле .lock для нескольких процессов)
+    по свежей копии с диска, поэтому параллельные правки не теряются.
+    Последний выданный id достопримечательности хранится в
+    attractions_data_meta.json рядом с данными.
+    """
+
+    def __init__(self, data_file, attractions_file, check_interval_ms=1000):
+        self.page_data_cache = JsonFileCache(data_file, dict, check_interval_ms)
+        self.attractions_cache = JsonFileCache(attractions_file, list, check_interval_ms)
+        self.meta_cache = JsonFileCache(os.path.splitext(attractions_file)[0] + '_meta.json', dict, check_interval_ms)
+        self._lock = threading.RLock()
+        self._lock_path = os.path.join(os.path.dirname(attractions_file) or '.', '.content.lock')
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _fresh(self, cache):
+        # Перед изменением читаем файл заново: его мог поменять другой процесс
+        cache.invalidate()
+        return thaw(cache.get())
+
+    def _allocate_id(self, attractions):
+        """Новый id из сохраненного счетчика (вызывается под блокировкой)"""
+        meta = self._fresh(self.meta_cache)
+        new_id = _next_attraction_id(meta.get('last_attraction_id', 0), attractions)
+        meta['last_attraction_id'] = new_id
+        self.meta_cache.store(meta)
+        return new_id
+
+    # Чтение
+
+    def get_page_data(self):
+        return self.page_data_cache.get()
+
+    def get_attractions(self):
+        return self.attractions_cache.get()
+
+    def expire(self):
+        """Следующее чтение сразу перепроверит файлы (их мог изменить другой процесс)"""
+        for cache in (self.page_data_cache, self.attractions_cache, self.meta_cache):
+            cache.expire()
+
+    def version(self):
+        """Версия данных для ключей кэша (меняется при любом изменении)"""
+        self.page_data_cache.get()
+        self.attractions_cache.get()
+        return (self.page_data_cache.version, self.attractions_cache.version)
+
+    # Данные страницы
+
+    def replace_page_data(self, data):
+        with self._locked():
+            self.page_data_cache.store(data)
+
+    def update_page_section(self, section, fields):
+        """Изменение нескольких полей раздела одной записью"""
+        with self._locked():
+            page_data = self._fresh(self.page_data_cache)
+            page_data.setdefault(section, {}).update(fields)
+            self.page_data_cache.store(page_data)
+
+    # Достопримечательности
+
+    def replace_attractions(self, attractions):
+        with self._locked():
+            self.attractions_cache.store([_strip_images(attraction) for attraction in attractions])
+
+    def create_attraction(self, build):
+        """Создание записи: build(new_id) возвращает словарь новой достопримечательности"""
+        with self._locked():
+            attractions = self._fresh(self.attractions_cache)
+            new_id = self._allocate_id(attractions)
+            attraction = _strip_images(build(new_id))
+            attractions.append(attraction)
+            self.attractions_cache.store(attractions)
+            return attraction
+
+    def modify_attraction(self, attraction_id, mutate):
+        """Изменение записи на месте функцией mutate(attraction); None, если не найдена"""
+        with self._locked():
+            attractions = self._fresh(self.attractions_cache)
+            for attraction in attractions:
+                if attraction.get('id') == attraction_id:
+                    mutate(attraction)
+                    self.attractions_cache.store(attractions)
+                    return attraction
+            return None
+
+    def delete_attraction(self, attraction_id):
+        """Удаление записи; возвращает удаленную запись или None"""
+        with self._locked():
+            attractions = self._fresh(self.attractions_cache)
+            for i, attraction in enumerate(attractions):
+                if attraction.get('id') == attraction_id:
+                    del attractions[i]
+                    self.attractions_cache.store(attractions)
+                    return attraction
+            return None
+
+    def reorder_attractions(self, ordered_ids):
+        """Новый порядок: позиция id в списке -> order (начиная с 1)"""
+        positions = {attraction_id: position for position, attraction_id in enumerate(ordered_ids, 1)}
+        with self._locked():
+            attractions = self._fresh(self.attractions_cache)
+            for attraction in attractions:
+                if attraction.get('id') in positions:
+                    attraction['order'] = positions[attraction['id']]
+            attractions.sort(key=lambda x: x.get('order', 0))
+            self.attractions_cache.store(attractions)
+
+    # Пакет изменений
+
+    def apply_batch(self, apply):
+        """Пакет изменений над свежими копиями данных.
+
+        apply(page_data, attractions, allocate_id) правит копии на месте,
+        allocate_id() выдает id для новых записей; исключение внутри apply
+        отменяет весь пакет. Иначе изменившиеся файлы записываются вместе
+        (store_many): либо все, либо ни одного. Возвращает результат apply.
+        """
+        with self._locked():
+            page_data = self._fresh(self.page_data_cache)
+            attractions = self._fresh(self.attractions_cache)
+            original_page_data = thaw(self.page_data_cache.get())
+            original_attractions = thaw(self.attractions_cache.get())
+            meta = self._fresh(self.meta_cache)
+            last_id = meta.get('last_attraction_id', 0)
+
+            def allocate_id():
+                meta['last_attraction_id'] = _next_attraction_id(meta.get('last_attraction_id', 0), attractions)
+                return meta['last_attraction_id']
+
+            result = apply(page_data, attractions, allocate_id)
+
+            attractions = [_strip_images(attraction) for attraction in attractions]
+            changes = []
+            if page_data != original_page_data:
+                changes.append((self.page_data_cache, page_data))
+            if attractions != original_attractions:
+                changes.append((self.attractions_cache, attractions))
+            if meta.get('last_attraction_id', 0) != last_id:
+                changes.append((self.meta_cache, meta))
+            if changes:
+                store_many(changes)
+            return result
+
+
+class SqliteStorage:
+    """Хранение контента в SQLite (режим WAL).
+
+    Разделы страницы и достопримечательности хранятся отдельными строками,
+    поэтому правка одного блока не переписывает весь документ, а каждая
+    операция выполняется в своей транзакции. Читатели держат снимок в
+    памяти и сверяют номер ревизии из таблицы meta не чаще раза в N мс.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS page_sections (
+            section TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS attractions (
+            id INTEGER PRIMARY KEY,
+            "order" INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS attractions_order ON attractions ("order", id);
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0);
+        INSERT OR IGNORE INTO meta (key, value)
+            SELECT 'last_attraction_id', COALESCE(MAX(id), 0) FROM attractions;
+    '''
+
+    def __init__(self, path, check_interval_ms=1000):
+        self.path = path
+        self.check_interval = check_interval_ms / 1000.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+        # Соединения SQLite нельзя переносить через fork
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        yield conn
+
+    @contextmanager
+    def _transaction(self):
+        """Транзакция записи; ревизия увеличивается при успешном завершении"""
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        # Следующее чтение сразу увидит изменения этого процесса
+        self._checked_at = 0.0
+
+    def _revision(self, conn):
+        return conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def _allocate_id(self, conn):
+        """Новый id из счетчика в meta (внутри транзакции записи)"""
+        conn.execute("""UPDATE meta SET value = MAX(value, (SELECT COALESCE(MAX(id), 0) FROM attractions)) + 1
+                        WHERE key = 'last_attraction_id'""")
+        return conn.execute("SELECT value FROM meta WHERE key = 'last_attraction_id'").fetchone()[0]
+
+    def _load(self, conn):
+        page_data = {section: json.loads(data) for section, data in
+                     conn.execute('SELECT section, data FROM page_sections ORDER BY rowid')}
+        attractions = [self._row_to_attraction(row) for row in
+                       conn.execute('SELECT id, "order", data FROM attractions ORDER BY "order", id')]
+        return page_data, attractions
+
+    @staticmethod
+    def _row_to_attraction(row):
+        attraction_id, order, data = row
+        attraction = {'id': attraction_id}
+        attraction.update(json.loads(data))
+        attraction['order'] = order
+        return attraction
+
+    @staticmethod
+    def _attraction_order(attraction):
+        # Колонка NOT NULL, а из формы может прийти "order": null (JSON-хранилище такое принимает)
+        return attraction.get('order') or 0
+
+    @staticmethod
+    def _attraction_data(attraction):
+        data = _strip_images(attraction)
+        for column in ATTRACTION_COLUMNS:
+            data.pop(column, None)
+        return json.dumps(data, ensure_ascii=False)
+
+    def _current(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            with self._connection() as conn:
+                revision = self._revision(conn)
+                if self._snapshot is None or self._snapshot[0] != revision:
+                    # Читаем в одной транзакции, чтобы снимок был согласованным
+                    conn.execute('BEGIN')
+                    try:
+                        revision = self._revision(conn)
+                        page_data, attractions = self._load(conn)
+                    finally:
+                        conn.execute('COMMIT')
+                    self._snapshot = (revision, freeze(page_data), freeze(attractions))
+                self._checked_at = time.monotonic()
+                return self._snapshot
+
+    # Чтение
+
+    def get_page_data(self):
+        return self._current()[1]
+
+    def get_attractions(self):
+        return self._current()[2]
+
+    def version(self):
+        return self._current()[0]
+
+    def expire(self):
+        """Следующее чтение сразу перепроверит ревизию в базе"""
+        self._checked_at = 0.0
+
+    # Данные страницы
+
+    def replace_page_data(self, data):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM page_sections')
+            conn.executemany('INSERT INTO page_sections (section, data) VALUES (?, ?)',
+                             [(section, json.dumps(value, ensure_ascii=False)) for section, value in data.items()])
+
+    def update_page_section(self, section, fields):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT data FROM page_sections WHERE section = ?', (section,)).fetchone()
+            value = json.loads(row[0]) if row else {}
+            value.update(fields)
+            conn.execute('INSERT OR REPLACE INTO page_sections (section, data) VALUES (?, ?)',
+                         (section, json.dumps(value, ensure_ascii=False)))
+
+    # Достопримечательности
+
+    def _insert_attraction(self, conn, attraction):
+        conn.execute('INSERT OR REPLACE INTO attractions (id, "order", data) VALUES (?, ?, ?)',
+                     (attraction['id'], self._attraction_order(attraction), self._attraction_data(attraction)))
+
+    def replace_attractions(self, attractions):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM attractions')
+            for attraction in attractions:
+                self._insert_attraction(conn, attraction)
+
+    def create_attraction(self, build):
+        with self._transaction() as conn:
+            new_id = self._allocate_id(conn)
+            attraction = _strip_images(build(new_id))
+            self._insert_attraction(conn, attraction)
+            return attraction
+
+    def modify_attraction(self, attraction_id, mutate):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT id, "order", data FROM attractions WHERE id = ?', (attraction_id,)).fetchone()
+            if row is None:
+                return None
+            attraction = self._row_to_attraction(row)
+            mutate(attraction)
+            conn.execute('UPDATE attractions SET "order" = ?, data = ? WHERE id = ?',
+                         (self._attraction_order(attraction), self._attraction_data(attraction), attraction_id))
+            return attraction
+
+    def delete_attraction(self, attraction_id):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT id, "order", data FROM attractions WHERE id = ?', (attraction_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM attractions WHERE id = ?', (attraction_id,))
+            return self._row_to_attraction(row)
+
+    def reorder_attractions(self, ordered_ids):
+        with self._transaction() as conn:
+            conn.executemany('UPDATE attractions SET "order" = ? WHERE id = ?',
+                             [(position, attraction_id) for position, attraction_id in enumerate(ordered_ids, 1)])
+
+    # Пакет изменений
+
+    def apply_batch(self, apply):
+        """Пакет изменений в одной транзакции; записываются только изменившиеся строки"""
+        with self._transaction() as conn:
+            page_data, attractions = self._load(conn)
+            original_sections = {section: json.dumps(value, ensure_ascii=False) for section, value in page_data.items()}
+            original_rows = {attraction['id']: (self._attraction_order(attraction), self._attraction_data(attraction))
+                             for attraction in attractions}
+
+            result = apply(page_data, attractions, lambda: self._allocate_id(conn))
+
+            sections = {section: json.dumps(value, ensure_ascii=False) for section, value in page_data.items()}
+            conn.executemany('DELETE FROM page_sections WHERE section = ?',
+                             [(section,) for section in original_sections if section not in sections])
+            conn.executemany('INSERT OR REPLACE INTO page_sections (section, data) VALUES (?, ?)',
+                             [(section, data) for section, data in sections.items()
+                              if original_sections.get(section) != data])
+
+            rows = {attraction['id']: (self._attraction_order(attraction), self._attraction_data(attraction))
+                    for attraction in attractions}
+            conn.executemany('DELETE FROM attractions WHERE id = ?',
+                             [(attraction_id,) for attraction_id in original_rows if attraction_id not in rows])
+            conn.executemany('INSERT OR REPLACE INTO attractions (id, "order", data) VALUES (?, ?, ?)',
+                             [(attraction_id, order, data) for attraction_id, (order, data) in rows.items()
+                              if original_rows.get(attraction_id) != (order, data)])
+            return result
+
+    # Перенос данных
+
+    def import_from(self, source):
+        """Однократный перенос всего контента из другого хранилища"""
+        page_data = thaw(source.get_page_data())
+        attractions = thaw(source.get_attractions())
+        ids = [attraction.get('id') for attraction in attractions]
+        if None in ids or len(set(ids)) != len(ids):
+            raise StorageError('У каждой достопримечательности должен быть уникальный id')
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM page_sections')
+            conn.executemany('INSERT INTO page_sections (section, data) VALUES (?, ?)',
+                             [(section, json.dumps(value, ensure_ascii=False)) for section, value in page_data.items()])
+            conn.execute('DELETE FROM attractions')
+            for attraction in attractions:
+                self._insert_attraction(conn, attraction)
+        return len(page_data), len(attractions)
+
+    def is_empty(self):
+        with self._connection() as conn:
+            sections = conn.execute('SELECT COUNT(*) FROM page_sections').fetchone()[0]
+            attractions = conn.execute('SELECT COUNT(*) FROM attractions').fetchone()[0]
+        return sections == 0 and attractions == 0
@@ -0,0 +1,26 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Metrics
+
+
+def test_shards_of_finished_threads_are_folded():
+    metrics = Metrics()
+
+    def request():
+        metrics.inc('requests_total', route='/')
+        metrics.observe('request_seconds', 0.01, route='/')
+
+    # Как у сервера с потоком на соединение: много коротких потоков подряд
+    for _ in range(300):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+
+    assert metrics.shard_count() <= 1
+    output = metrics.render_prometheus()
+    assert 'requests_total{route="/"} 300' in output
+    assert 'request_seconds_count{route="/"} 300' in output
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from collections import namedtuple
+from contextlib import nullcontext
+
+from werkzeug.utils import secure_filename
+
+
+# Размер блока при потоковой записи загружаемого файла
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Сигнатуры форматов: расширение сохраняемого файла определяется по содержимому
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+# Расширения, которые считаются одним форматом
+EQUIVALENT_EXTENSIONS = {'jpeg': 'jpg'}
+
+
+# Результат сохранения: duplicate=True, если файл с таким содержимым уже был
+# и новый не записывался (filename — имя существующего файла)
+StoredUpload = namedtuple('StoredUpload', ['filename', 'size', 'sha256', 'duplicate'])
+
+
+class UploadError(Exception):
+    """Ошибка загрузки, текст которой можно показать администратору"""
+
+
+def sniff_image_type(header):
+    """Определение формата изображения по первым байтам"""
+    for signature, ext in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return ext
+    if len(header) >= 12 and header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _read_header(stream, size):
+    header = b''
+    while len(header) < size:
+        chunk = stream.read(size - len(header))
+        if not chunk:
+            break
+        header += chunk
+    return header
+
+
+def store_uploaded_image(file, upload_folder, max_size, find_duplicate=None, lock=None, record=None):
+    """Потоковое сохранение загруженного изображения.
+
+    Файл пишется блоками во временный файл в целевой папке и
+    публикуется атомарным os.replace, поэтому недописанный файл
+    никогда не виден сайту. По ходу записи считается sha256: если
+    find_duplicate(sha256) вернет имя существующего файла, временный
+    файл удаляется, а в результате возвращается это имя. Проверка
+    повтора, os.replace и record(filename, sha256) выполняются под
+    контекстным менеджером lock, так что одинаковые файлы, загружаемые
+    одновременно, не сохранятся дважды. Возвращает StoredUpload.
+    """
+    original_filename = secure_filename(file.filename) or 'image'
+    name, ext = os.path.splitext(original_filename)
+
+    header = _read_header(file.stream, UPLOAD_CHUNK_SIZE)
+    kind = sniff_image_type(header)
+    if kind is None:
+        raise UploadError('Файл не является изображением (PNG, JPG, JPEG, GIF, WEBP)')
+
+    # Сохраняем исходное расширение, если оно соответствует содержимому
+    declared = ext.lstrip('.').lower()
+    if EQUIVALENT_EXTENSIONS.get(declared, declared) != kind:
+        ext = '.' + kind
+    unique_filename = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
+
+    os.makedirs(upload_folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', suffix='.tmp', dir=upload_folder)
+    try:
+        size = 0
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as out:
+            # mkstemp создает файл с правами 0600, а изображение должно быть доступно веб-серверу
+            os.chmod(tmp_path, 0o644)
+            chunk = header
+            while chunk:
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadError(f'Файл слишком большой. Максимальный размер: {max_size // (1024*1024)}MB')
+                out.write(chunk)
+                digest.update(chunk)
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+            out.flush()
+            os.fsync(out.fileno())
+        sha256 = digest.hexdigest()
+
+        with lock if lock is not None else nullcontext():
+            existing = find_duplicate(sha256) if find_duplicate is not None else None
+            if existing is not None:
+                os.remove(tmp_path)
+                return StoredUpload(existing, size, sha256, True)
+            os.replace(tmp_path, os.path.join(upload_folder, unique_filename))
+            if record is not None:
+                record(unique_filename, sha256)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return StoredUpload(unique_filename, size, sha256, False)